@@ -139,6 +139,24 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# uploaded files (e.g. candidate snapshots) are stored in MEDIA_ROOT, unless an S3 compatible bucket is configured
+# (AWS S3, or MinIO in docker-compose-dev.yml). with a bucket, celery workers on other machines can read the snapshots.
+AWS_STORAGE_BUCKET_NAME = os.environ.get("AWS_STORAGE_BUCKET_NAME")
+if AWS_STORAGE_BUCKET_NAME:
+    DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+    AWS_S3_ENDPOINT_URL = os.environ.get("AWS_S3_ENDPOINT_URL")  # not needed for AWS S3
+    AWS_S3_REGION_NAME = os.environ.get("AWS_S3_REGION_NAME")
+    AWS_ACCESS_KEY_ID = os.environ.get("AWS_ACCESS_KEY_ID")
+    AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
+
+    # files are private, their urls are signed and expire after AWS_QUERYSTRING_EXPIRE seconds
+    AWS_DEFAULT_ACL = None
+    AWS_QUERYSTRING_AUTH = True
+    AWS_QUERYSTRING_EXPIRE = int(os.environ.get("AWS_QUERYSTRING_EXPIRE", 3600))
+
+    # same as the local storage, existing files are never overwritten
+    AWS_S3_FILE_OVERWRITE = False
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -171,6 +189,154 @@ CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL")
 # judge0 settings
 JUDGE0_URL = os.environ.get("JUDGE0_URL")
 
+# judge0 client connection settings (seconds)
+JUDGE0_CONNECT_TIMEOUT = float(os.environ.get("JUDGE0_CONNECT_TIMEOUT", 3.0))
+JUDGE0_READ_TIMEOUT = float(os.environ.get("JUDGE0_READ_TIMEOUT", 10.0))
+JUDGE0_MAX_RETRIES = int(os.environ.get("JUDGE0_MAX_RETRIES", 2))
+JUDGE0_POOL_SIZE = int(os.environ.get("JUDGE0_POOL_SIZE", 10))
+
+# base url of this server as seen from judge0, used to receive submission results via callbacks.
+# if not set, the results are retrieved by polling judge0 instead.
+JUDGE0_CALLBACK_URL = os.environ.get("JUDGE0_CALLBACK_URL")
+
+# seconds to wait for a callback before a pending test case attempt is polled (lost callbacks)
+JUDGE0_CALLBACK_GRACE_PERIOD = int(os.environ.get("JUDGE0_CALLBACK_GRACE_PERIOD", 30))
+
+# max number of submissions per batch request, must not exceed MAX_SUBMISSION_BATCH_SIZE of judge0 (default 20)
+JUDGE0_BATCH_SIZE = int(os.environ.get("JUDGE0_BATCH_SIZE", 20))
+
+# seconds between each poll of the pending test case attempts
+JUDGE0_POLL_INTERVAL = float(os.environ.get("JUDGE0_POLL_INTERVAL", 1.0))
+
+# reuse the results of identical submissions (same language, code, test case and limits) instead of executing them again
+JUDGE0_RESULT_CACHE = os.environ.get("JUDGE0_RESULT_CACHE", "1") == "1"
+
+# seconds that a pending "Compile and Run" submission is shared with identical submissions
+JUDGE0_RESULT_CACHE_PENDING_TTL = int(os.environ.get("JUDGE0_RESULT_CACHE_PENDING_TTL", 60))
+
+# the score of a submitted assessment attempt is computed once its last submission has been processed.
+# seconds between the safety net retries while submissions are still processing, and the max number of retries
+SCORE_RETRY_DELAY = int(os.environ.get("SCORE_RETRY_DELAY", 60))
+SCORE_MAX_RETRIES = int(os.environ.get("SCORE_MAX_RETRIES", 30))
+
+# seconds between each check for submitted attempts that are still not scored once their submissions have been
+# processed (e.g. the completion of the last submission was missed), whose scores are then computed
+SCORE_SWEEP_INTERVAL = float(os.environ.get("SCORE_SWEEP_INTERVAL", 300.0))
+
+# seconds between each check for overdue assessment attempts, to be submitted automatically
+ATTEMPT_DEADLINE_SWEEP_INTERVAL = float(os.environ.get("ATTEMPT_DEADLINE_SWEEP_INTERVAL", 10.0))
+
+# rows read from the database per query by the streamed report exports
+REPORT_EXPORT_CHUNK_SIZE = int(os.environ.get("REPORT_EXPORT_CHUNK_SIZE", 2000))
+
+# seconds without progress after which a pending or running report job is considered lost (e.g. worker restarted) and
+# is queued again when the report is requested
+REPORT_JOB_TIMEOUT = int(os.environ.get("REPORT_JOB_TIMEOUT", 600))
+
+# seconds after which the finished report jobs of previous versions of a report (and their files) are deleted, once a
+# newer version has been built. they may still be polled or downloaded in the meantime
+REPORT_JOB_RETENTION = int(os.environ.get("REPORT_JOB_RETENTION", 3600))
+
+# maximum number of attempts per page of the report tables (see get_best_attempts)
+REPORT_PAGE_SIZE = int(os.environ.get("REPORT_PAGE_SIZE", 500))
+
+# plagiarism screening: index the best submission of each question attempt once processed (1), tokens per k-gram,
+# k-grams per winnowing window, min share of the fingerprints of a submission found in the other one to report a pair,
+# and max share (and max number) of the attempts of a question a fingerprint can be found in (more common fingerprints
+# are ignored, the pairs of each fingerprint are counted)
+PLAGIARISM_INDEX = os.environ.get("PLAGIARISM_INDEX", "1") == "1"
+PLAGIARISM_KGRAM = int(os.environ.get("PLAGIARISM_KGRAM", 8))
+PLAGIARISM_WINDOW = int(os.environ.get("PLAGIARISM_WINDOW", 4))
+PLAGIARISM_MIN_OVERLAP = float(os.environ.get("PLAGIARISM_MIN_OVERLAP", 0.5))
+PLAGIARISM_MAX_FREQUENCY = float(os.environ.get("PLAGIARISM_MAX_FREQUENCY", 0.1))
+PLAGIARISM_MAX_ATTEMPTS = int(os.environ.get("PLAGIARISM_MAX_ATTEMPTS", 30))
+
+# face detection of the candidate snapshots: InsightFace model pack and detection input size (pixels)
+FACE_DETECTION_MODEL_PACK = os.environ.get("FACE_DETECTION_MODEL_PACK", "buffalo_sc")
+FACE_DETECTION_DET_SIZE = (int(os.environ.get("FACE_DETECTION_DET_SIZE", 640)),) * 2
+
+# onnxruntime threads of the face detection model in each process (0 = onnxruntime default, all cores)
+FACE_DETECTION_INTRA_OP_THREADS = int(os.environ.get("FACE_DETECTION_INTRA_OP_THREADS", 0))
+FACE_DETECTION_INTER_OP_THREADS = int(os.environ.get("FACE_DETECTION_INTER_OP_THREADS", 0))
+
+# named face detection profiles: detection input size (pixels, multiple of 32) and onnxruntime threads of the model.
+# FACE_DETECTION_PROFILE selects the profile of the workers, the "default" profile is set by the variables above.
+# profiles can be compared on sample images with the benchmark_face_detection management command
+FACE_DETECTION_PROFILES = {
+    "default": {
+        "det_size": FACE_DETECTION_DET_SIZE,
+        "intra_op_threads": FACE_DETECTION_INTRA_OP_THREADS,
+        "inter_op_threads": FACE_DETECTION_INTER_OP_THREADS,
+    },
+    "balanced": {
+        "det_size": (480, 480),
+        "intra_op_threads": 2,
+        "inter_op_threads": 1,
+    },
+    "fast": {
+        "det_size": (320, 320),
+        "intra_op_threads": 1,
+        "inter_op_threads": 1,
+    },
+}
+FACE_DETECTION_PROFILE = os.environ.get("FACE_DETECTION_PROFILE", "default")
+
+# processes detecting the faces of the initial snapshots for the web server, max number of images waiting for a
+# process (further requests are rejected), and seconds to wait for the result
+FACE_DETECTION_POOL_SIZE = int(os.environ.get("FACE_DETECTION_POOL_SIZE", 2))
+FACE_DETECTION_POOL_QUEUE = int(os.environ.get("FACE_DETECTION_POOL_QUEUE", 8))
+FACE_DETECTION_POOL_TIMEOUT = float(os.environ.get("FACE_DETECTION_POOL_TIMEOUT", 10.0))
+
+# uploaded snapshots are stored downscaled (longest side, pixels) and re-encoded ("jpg" or "webp", quality 0-100),
+# along with a thumbnail for the review gallery. the original upload is only kept if SNAPSHOT_KEEP_ORIGINAL=1
+SNAPSHOT_MAX_SIZE = int(os.environ.get("SNAPSHOT_MAX_SIZE", FACE_DETECTION_PROFILES[FACE_DETECTION_PROFILE]["det_size"][0]))
+SNAPSHOT_THUMBNAIL_SIZE = int(os.environ.get("SNAPSHOT_THUMBNAIL_SIZE", 320))
+SNAPSHOT_FORMAT = os.environ.get("SNAPSHOT_FORMAT", "jpg")
+SNAPSHOT_QUALITY = int(os.environ.get("SNAPSHOT_QUALITY", 80))
+SNAPSHOT_KEEP_ORIGINAL = os.environ.get("SNAPSHOT_KEEP_ORIGINAL", "0") == "1"
+
+# max number of different bits of the image hashes (0-64) for a snapshot to be considered a near-duplicate of the
+# previous snapshot of the attempt, whose face detection result is reused. -1 detects the faces of every snapshot
+SNAPSHOT_DUPLICATE_THRESHOLD = int(os.environ.get("SNAPSHOT_DUPLICATE_THRESHOLD", 4))
+
+# review gallery of the snapshots of an attempt: snapshots per page, and seconds the browsers may cache the thumbnails
+# (the files of a snapshot never change)
+SNAPSHOT_PAGE_SIZE = int(os.environ.get("SNAPSHOT_PAGE_SIZE", 30))
+SNAPSHOT_THUMBNAIL_MAX_AGE = int(os.environ.get("SNAPSHOT_THUMBNAIL_MAX_AGE", 7 * 24 * 3600))
+
+# face detection of the pending snapshots: seconds between each run, snapshots per batch and decode/detect threads
+FACE_DETECTION_INTERVAL = float(os.environ.get("FACE_DETECTION_INTERVAL", 2.0))
+FACE_DETECTION_BATCH_SIZE = int(os.environ.get("FACE_DETECTION_BATCH_SIZE", 32))
+FACE_DETECTION_WORKERS = int(os.environ.get("FACE_DETECTION_WORKERS", 4))
+
+# seconds after which a snapshot claimed by a face detection run is detected again if it is still pending (detection
+# error, e.g. storage unavailable, or worker restarted)
+FACE_DETECTION_CLAIM_TIMEOUT = int(os.environ.get("FACE_DETECTION_CLAIM_TIMEOUT", 300))
+
+# periodic tasks (run by celery beat, see docker-compose.yml)
+CELERY_BEAT_SCHEDULE = {
+    'poll-pending-test-case-attempts': {
+        'task': 'core.tasks.poll_pending_test_case_attempts',
+        'schedule': JUDGE0_POLL_INTERVAL,
+        'options': {'expires': JUDGE0_POLL_INTERVAL},
+    },
+    'force-submit-overdue-assessment-attempts': {
+        'task': 'core.tasks.force_submit_overdue_assessment_attempts',
+        'schedule': ATTEMPT_DEADLINE_SWEEP_INTERVAL,
+        'options': {'expires': ATTEMPT_DEADLINE_SWEEP_INTERVAL},
+    },
+    'score-unscored-assessment-attempts': {
+        'task': 'core.tasks.score_unscored_assessment_attempts',
+        'schedule': SCORE_SWEEP_INTERVAL,
+        'options': {'expires': SCORE_SWEEP_INTERVAL},
+    },
+    'detect-faces-pending-snapshots': {
+        'task': 'core.tasks.detect_faces_pending_snapshots',
+        'schedule': FACE_DETECTION_INTERVAL,
+        'options': {'expires': FACE_DETECTION_INTERVAL},
+    },
+}
+
 FORMAT_MODULE_PATH = [
     'aasp.formats',
 ]
@@ -1,2 +1,3 @@
 DEBUG = True
-ALLOWED_HOSTS = ['127.0.0.1', 'localhost', '172.21.148.181']
+# host.docker.internal: judge0 callbacks from the containers of docker-compose-dev.yml (see JUDGE0_CALLBACK_URL)
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost', '172.21.148.181', 'host.docker.internal']
@@ -13,4 +13,5 @@ python3 manage.py collectstatic --no-input
 python3 manage.py migrate --no-input
 
 # run gunicorn
-gunicorn --bind 0.0.0.0:8000 aasp.wsgi
+# threaded workers, a request waiting for the face detection pool does not block the other requests of its worker
+gunicorn --bind 0.0.0.0:8000 --worker-class gthread --workers ${GUNICORN_WORKERS:-2} --threads ${GUNICORN_THREADS:-8} aasp.wsgi
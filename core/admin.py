@@ -27,7 +27,7 @@ class CodeQuestionAdmin(admin.ModelAdmin):
 
 
 class LanguageAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'judge_language_id')
+    list_display = ('id', 'name', 'judge_language_id', 'file_extension')
 
 
 class CodeTemplateAdmin(admin.ModelAdmin):
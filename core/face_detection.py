@@ -0,0 +1,132 @@
+# face detection of the candidate snapshots
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+import onnxruntime
+from django.conf import settings
+from insightface.app import FaceAnalysis
+
+_detector = None
+_detector_pid = None
+_detector_lock = threading.Lock()
+
+
+def get_profile(name=None) -> dict:
+    """
+    Returns a face detection profile (FACE_DETECTION_PROFILES), by default the FACE_DETECTION_PROFILE of the workers.
+    """
+    name = name or settings.FACE_DETECTION_PROFILE
+    if name not in settings.FACE_DETECTION_PROFILES:
+        raise ValueError(f"Unknown face detection profile: {name}")
+    return settings.FACE_DETECTION_PROFILES[name]
+
+
+def _session_options(profile) -> onnxruntime.SessionOptions:
+    """
+    ONNX Runtime options of the detection model, 0 threads leaves the choice to onnxruntime (all cores).
+    """
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = profile["intra_op_threads"]
+    options.inter_op_num_threads = profile["inter_op_threads"]
+    return options
+
+
+def load_detector(profile) -> FaceAnalysis:
+    """
+    Loads a new face detector with the given profile, use get_detector() to get the shared detector of the process.
+    """
+    # only the detection model of the model pack is needed (number of faces)
+    detector = FaceAnalysis(name=settings.FACE_DETECTION_MODEL_PACK, allowed_modules=['detection'])
+
+    # insightface does not pass session options to onnxruntime, recreate the session of the detection model with them
+    det_model = detector.det_model
+    det_model.session = onnxruntime.InferenceSession(det_model.model_file, sess_options=_session_options(profile),
+                                                     providers=det_model.session.get_providers())
+
+    detector.prepare(ctx_id=0, det_size=tuple(profile["det_size"]))
+    return detector
+
+
+def get_detector() -> FaceAnalysis:
+    """
+    Returns the face detector (FACE_DETECTION_PROFILE) of the process, loaded on first use and shared by all threads.
+    Celery will take some time to download the model pack on the first run, progress can be viewed in the container logs.
+    """
+    global _detector, _detector_pid
+    if _detector is None or _detector_pid != os.getpid():
+        with _detector_lock:
+            if _detector is None or _detector_pid != os.getpid():
+                _detector = load_detector(get_profile())
+                _detector_pid = os.getpid()
+    return _detector
+
+
+def count_faces(image) -> int:
+    """
+    Returns the number of faces detected in an image (numpy array, as decoded by cv2).
+    """
+    return len(get_detector().get(image))
+
+
+class DetectionPoolBusy(Exception):
+    """
+    The detection pool already has FACE_DETECTION_POOL_SIZE + FACE_DETECTION_POOL_QUEUE images in progress.
+    """
+
+
+_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+def _count_faces_in_upload(data) -> int:
+    # runs in a process of the detection pool
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return count_faces(image)
+
+
+def _get_pool():
+    global _pool, _pool_pid, _pool_slots
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                # spawned (not forked) processes, the web server process may have threads and open connections.
+                # the detector is loaded when each process starts, not by the first request
+                _pool = ProcessPoolExecutor(max_workers=settings.FACE_DETECTION_POOL_SIZE,
+                                            mp_context=multiprocessing.get_context('spawn'), initializer=get_detector)
+                _pool_slots = threading.BoundedSemaphore(settings.FACE_DETECTION_POOL_SIZE + settings.FACE_DETECTION_POOL_QUEUE)
+                _pool_pid = os.getpid()
+    return _pool, _pool_slots
+
+
+def count_faces_in_upload(data) -> int:
+    """
+    Returns the number of faces detected in an uploaded image (encoded bytes), used by the web server.
+    The image is decoded and detected in a separate process pool, so that the model and the inference do not run in the
+    web server processes.
+    Raises DetectionPoolBusy immediately if too many images are in progress, and concurrent.futures.TimeoutError if the
+    result is not available within FACE_DETECTION_POOL_TIMEOUT seconds.
+    """
+    global _pool
+    pool, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise DetectionPoolBusy()
+
+    try:
+        future = pool.submit(_count_faces_in_upload, data)
+    except BrokenProcessPool:
+        # a process of the pool died (e.g. killed when out of memory), a new pool is created by the next request
+        slots.release()
+        _pool = None
+        raise
+
+    # the slot is only released once the image is done, even if the request has timed out
+    future.add_done_callback(lambda f: slots.release())
+    return future.result(timeout=settings.FACE_DETECTION_POOL_TIMEOUT)
@@ -0,0 +1,268 @@
+# helpers for communicating with judge0
+import base64
+import hashlib
+import json
+import os
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from core.models import Judge0Result
+
+# statuses that only depend on the submission itself, these results are reused for identical submissions.
+# other results (e.g. time limit exceeded, internal error) also depend on the load of judge0 and are never reused.
+CACHEABLE_STATUSES = [3, 4, 6]
+
+
+def callbacks_enabled() -> bool:
+    """
+    Returns if judge0 should push submission results to us (callbacks), instead of being polled.
+    """
+    return bool(settings.JUDGE0_CALLBACK_URL)
+
+
+def callback_key() -> str:
+    """
+    Shared secret included in the callback url, judge0 cannot send custom headers with its callbacks.
+    Derived from SECRET_KEY, so no extra configuration is needed.
+    """
+    return salted_hmac("core.judge0.callback", "judge0-callback").hexdigest()
+
+
+def verify_callback_key(key) -> bool:
+    return key is not None and constant_time_compare(key, callback_key())
+
+
+def callback_url() -> str:
+    """
+    The url that judge0 will PUT the submission result to, once the submission has been processed.
+    """
+    return f"{settings.JUDGE0_CALLBACK_URL.rstrip('/')}{reverse('judge0-callback')}?key={callback_key()}"
+
+
+def parse_callback(data) -> dict:
+    """
+    Judge0 always sends callbacks base64 encoded and with the status as a nested object.
+    Converts the callback body to the same format as a polled submission (base64_encoded=false).
+    """
+    stdout = data.get('stdout')
+    if stdout is not None:
+        stdout = base64.b64decode(stdout).decode('utf-8', errors='replace')
+
+    return {
+        "token": data.get('token'),
+        "status_id": (data.get('status') or {}).get('id'),
+        "stdout": stdout,
+        "time": data.get('time'),
+        "memory": data.get('memory'),
+    }
+
+
+def submission_digest(params) -> str:
+    """
+    Hash of everything that determines the result of a submission: language, source code (or zip file), stdin,
+    expected output and limits. Identical submissions have the same digest.
+    """
+    fields = ("language_id", "source_code", "additional_files", "stdin", "expected_output", "cpu_time_limit", "memory_limit")
+    values = [None if params.get(field) is None else str(params.get(field)) for field in fields]
+    return hashlib.sha256(json.dumps(values).encode('utf-8')).hexdigest()
+
+
+def get_cached_results(digests) -> dict:
+    """
+    Returns the reusable results of the given digests, keyed by digest. Digests without a reusable result are omitted.
+    """
+    if not settings.JUDGE0_RESULT_CACHE:
+        return {}
+    results = Judge0Result.objects.filter(digest__in=set(digests), status__in=CACHEABLE_STATUSES)
+    return {result.digest: result for result in results}
+
+
+def get_cached_token(digest):
+    """
+    Returns the token of an identical submission, which either has a reusable result or is still pending
+    (submitted within JUDGE0_RESULT_CACHE_PENDING_TTL). Returns None if the submission has to be executed.
+    """
+    if not settings.JUDGE0_RESULT_CACHE:
+        return None
+    result = Judge0Result.objects.filter(digest=digest).first()
+    if result is None:
+        return None
+    if result.status in CACHEABLE_STATUSES:
+        return result.token
+    if not result.finished and result.last_updated > timezone.now() - timedelta(seconds=settings.JUDGE0_RESULT_CACHE_PENDING_TTL):
+        return result.token
+    return None
+
+
+def cache_pending_submission(digest, token):
+    """
+    Records a submission that has just been sent to judge0, its result is recorded by cache_submission_result.
+    Replaces a stale pending submission of the same digest, a reusable result recorded in the meantime (e.g. by a
+    concurrent identical submission) is kept. Never raises on a concurrent insert of the same digest.
+    """
+    if not settings.JUDGE0_RESULT_CACHE:
+        return
+    replaced = Judge0Result.objects.filter(digest=digest).exclude(status__in=CACHEABLE_STATUSES) \
+        .update(token=token, status=1, stdout=None, time=None, memory=None, last_updated=timezone.now())
+    if not replaced:
+        Judge0Result.objects.bulk_create([Judge0Result(digest=digest, token=token, status=1)], ignore_conflicts=True)
+
+
+def cache_submission_result(token, data):
+    """
+    Records the result of a pending submission (data as retrieved from judge0, with status_id, stdout, time and memory).
+    Results that cannot be reused are removed, so that the submission is executed again next time.
+    """
+    status_id = int(data['status_id'])
+    if status_id in [1, 2]:
+        return
+
+    pending = Judge0Result.objects.filter(token=token, status__in=[1, 2])
+    if status_id in CACHEABLE_STATUSES:
+        pending.update(status=status_id, stdout=data.get('stdout'), time=data.get('time'), memory=data.get('memory'),
+                       last_updated=timezone.now())
+    else:
+        pending.delete()
+
+
+def cache_test_case_attempt_results(test_case_attempts):
+    """
+    Records the reusable results of finished TestCaseAttempts. Existing results of the same digest are kept.
+    """
+    if not settings.JUDGE0_RESULT_CACHE:
+        return
+    Judge0Result.objects.bulk_create([
+        Judge0Result(digest=tca.digest, token=tca.token, status=tca.status, stdout=tca.stdout, time=tca.time, memory=tca.memory)
+        for tca in test_case_attempts if tca.digest and tca.status in CACHEABLE_STATUSES
+    ], ignore_conflicts=True)
+
+
+class Judge0Error(Exception):
+    """
+    Base class of the errors raised by Judge0Client.
+    """
+
+
+class Judge0ConnectionError(Judge0Error):
+    """
+    Judge0 could not be reached, or did not respond within the timeout.
+    """
+
+
+class Judge0ResponseError(Judge0Error):
+    """
+    Judge0 returned an error status code, or a response that could not be understood.
+    """
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Judge0Client:
+    """
+    Client for the judge0 api.
+    Keeps a pool of keep-alive connections to judge0, applies connect/read timeouts to every request and retries
+    failed connections (and idempotent requests) with exponential backoff.
+    Use get_client() to get the shared instance of the current process.
+    """
+
+    def __init__(self, base_url, connect_timeout=3.0, read_timeout=10.0, max_retries=2, pool_size=10, batch_size=20):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.batch_size = batch_size
+
+        # connection errors are retried for all methods (the request was not sent),
+        # read errors and 502/503/504 responses are only retried for GET requests (submitting twice creates duplicates)
+        retry = Retry(total=max_retries, backoff_factor=0.2, status_forcelist=[502, 503, 504],
+                      allowed_methods=frozenset(["GET"]), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _request(self, method, path, **kwargs):
+        try:
+            res = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+            raise Judge0ConnectionError(str(ex)) from ex
+        except requests.exceptions.RequestException as ex:
+            raise Judge0Error(str(ex)) from ex
+
+        if res.status_code >= 400:
+            raise Judge0ResponseError(f"{method} {path} returned {res.status_code}.", status_code=res.status_code)
+
+        try:
+            return res.json()
+        except ValueError as ex:
+            raise Judge0ResponseError(f"{method} {path} returned an invalid response.", status_code=res.status_code) from ex
+
+    def create_submission(self, params) -> str:
+        """
+        Submits a single submission (wait=false), returns its token.
+        """
+        data = self._request("POST", "/submissions/?base64_encoded=false&wait=false", json=params)
+        token = data.get("token")
+        if not token:
+            raise Judge0ResponseError(f"No token returned. {data}")
+        return token
+
+    def create_submissions(self, submissions) -> list:
+        """
+        Submits multiple submissions, in batches of batch_size. Returns the tokens, in the same order as the submissions.
+        """
+        tokens = []
+        for i in range(0, len(submissions), self.batch_size):
+            data = self._request("POST", "/submissions/batch?base64_encoded=false",
+                                 json={"submissions": submissions[i:i + self.batch_size]})
+            for item in data:
+                if not item.get("token"):
+                    raise Judge0ResponseError(f"No token returned. {item}")
+                tokens.append(item["token"])
+        return tokens
+
+    def get_submission(self, token, fields) -> dict:
+        """
+        Retrieves a single submission.
+        """
+        return self._request("GET", f"/submissions/{token}?base64_encoded=false&fields={fields}")
+
+    def get_submissions(self, tokens, fields) -> list:
+        """
+        Retrieves multiple submissions, in batches of batch_size.
+        Returns the submissions in the same order as the tokens, unknown tokens are returned as None.
+        """
+        submissions = []
+        for i in range(0, len(tokens), self.batch_size):
+            batch = ",".join(tokens[i:i + self.batch_size])
+            data = self._request("GET", f"/submissions/batch?tokens={batch}&base64_encoded=false&fields={fields}")
+            submissions.extend(data.get("submissions", []))
+        return submissions
+
+
+_client = None
+_client_pid = None
+
+
+def get_client() -> Judge0Client:
+    """
+    Returns the Judge0Client of the current process, the client is created on first use.
+    (celery and gunicorn fork worker processes, connections must not be shared across processes)
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = Judge0Client(settings.JUDGE0_URL,
+                               connect_timeout=settings.JUDGE0_CONNECT_TIMEOUT,
+                               read_timeout=settings.JUDGE0_READ_TIMEOUT,
+                               max_retries=settings.JUDGE0_MAX_RETRIES,
+                               pool_size=settings.JUDGE0_POOL_SIZE,
+                               batch_size=settings.JUDGE0_BATCH_SIZE)
+        _client_pid = os.getpid()
+    return _client
@@ -0,0 +1,43 @@
+from django.core.management import BaseCommand
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from core.models import CodeQuestionSubmission, CodeQuestionAttempt
+
+
+class Command(BaseCommand):
+    help = "Fills the score of processed CodeQuestionSubmissions that do not have one yet, " \
+           "and recomputes the best score of every CodeQuestionAttempt"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="number of submissions updated per query")
+
+    def handle(self, *args, **options):
+        self.stdout.write('Running backfill scores management command')
+
+        # stage 1: scores of the processed submissions (sum of the scores of the accepted test cases)
+        self.stdout.write('[1] Submission scores:')
+        submissions = CodeQuestionSubmission.objects.filter(score__isnull=True, passed__isnull=False) \
+            .annotate(computed_score=Coalesce(Sum('testcaseattempt__test_case__score', filter=Q(testcaseattempt__status=3)), 0)) \
+            .only('id').order_by('id')
+
+        total = 0
+        while True:
+            # updated submissions no longer match the filter
+            batch = list(submissions[:options['batch_size']])
+            if not batch:
+                break
+            for cqs in batch:
+                cqs.score = cqs.computed_score
+            CodeQuestionSubmission.objects.bulk_update(batch, ['score'])
+            total += len(batch)
+            self.stdout.write(f'  - {total} submissions updated')
+
+        # stage 2: best score of each question attempt
+        self.stdout.write('[2] Best scores of question attempts:')
+        best_score = CodeQuestionSubmission.objects.filter(cq_attempt=OuterRef('pk'), score__isnull=False) \
+            .order_by('-score').values('score')[:1]
+        count = CodeQuestionAttempt.objects.update(best_score=Coalesce(Subquery(best_score), 0))
+        self.stdout.write(f'  - {count} question attempts updated')
+
+        self.stdout.write(self.style.SUCCESS('\nSuccessfully completed backfill_scores!'))
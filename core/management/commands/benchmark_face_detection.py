@@ -0,0 +1,109 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from core.face_detection import get_profile, load_detector
+from core.models import CandidateSnapshot
+from core.snapshots import read_image, resize_to_fit
+
+
+class Command(BaseCommand):
+    help = "Runs the face detector profiles (FACE_DETECTION_PROFILES) over sample images and reports the throughput, " \
+           "p50/p95 latency and the agreement of the number of faces detected with a reference profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="image files or directories of sample images")
+        parser.add_argument('--snapshots', type=int, default=0, help="also use the latest N stored candidate snapshots")
+        parser.add_argument('--profiles', nargs='+', help="profiles to compare (default: all)")
+        parser.add_argument('--reference', help="profile whose results are considered correct (default: the profile "
+                                                "with the largest detection size)")
+        parser.add_argument('--image-sizes', type=int, nargs='+', default=[settings.SNAPSHOT_MAX_SIZE],
+                            help="longest side (pixels) the images are downscaled to before detection")
+        parser.add_argument('--workers', type=int, default=1, help="threads sharing each detector, "
+                                                                   "as the FACE_DETECTION_WORKERS of the workers")
+        parser.add_argument('--warmup', type=int, default=3, help="images detected before timing each profile")
+
+    def handle(self, *args, **options):
+        self.stdout.write('Running benchmark face detection management command')
+
+        profiles = options['profiles'] or list(settings.FACE_DETECTION_PROFILES)
+        reference = options['reference'] or max(profiles, key=lambda name: get_profile(name)['det_size'][0])
+        try:
+            for name in profiles + [reference]:
+                get_profile(name)
+        except ValueError as ex:
+            raise CommandError(ex)
+        # the reference profile runs first, its results are compared with the other profiles
+        profiles = [reference] + [name for name in profiles if name != reference]
+
+        # stage 1: sample images
+        self.stdout.write('[1] Loading images:')
+        images = self.load_images(options['paths'], options['snapshots'])
+        if not images:
+            raise CommandError("No sample images, pass image files/directories or --snapshots.")
+        self.stdout.write(f'  - {len(images)} images loaded')
+
+        # stage 2: detection of each image size with each profile
+        self.stdout.write(f'[2] Detection ({options["workers"]} worker(s), reference profile: {reference}):')
+        detectors = {name: load_detector(get_profile(name)) for name in profiles}
+        for image_size in options['image_sizes']:
+            resized = [resize_to_fit(image, image_size) for image in images]
+            self.stdout.write(f'  Images downscaled to {image_size}px:')
+            self.stdout.write(f'    {"profile":<12} {"det_size":>9} {"threads":>7} {"images/s":>9} {"p50 ms":>8} '
+                              f'{"p95 ms":>8} {"agreement":>9}')
+
+            reference_counts = None
+            for name in profiles:
+                counts, latencies, elapsed = self.run(detectors[name], resized, options['workers'], options['warmup'])
+                if reference_counts is None:
+                    reference_counts = counts
+                agreement = np.mean([count == reference_count for count, reference_count in zip(counts, reference_counts)])
+
+                profile = get_profile(name)
+                threads = f'{profile["intra_op_threads"]}/{profile["inter_op_threads"]}'
+                self.stdout.write(f'    {name:<12} {profile["det_size"][0]:>9} {threads:>7} {len(resized) / elapsed:>9.1f} '
+                                  f'{np.percentile(latencies, 50) * 1000:>8.1f} {np.percentile(latencies, 95) * 1000:>8.1f} '
+                                  f'{agreement:>9.1%}')
+
+        self.stdout.write(self.style.SUCCESS('\nSuccessfully completed benchmark_face_detection!'))
+
+    @staticmethod
+    def load_images(paths, snapshots):
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files += sorted(os.path.join(path, name) for name in os.listdir(path))
+            else:
+                files.append(path)
+
+        # files that are not images are skipped
+        images = [cv2.imread(file, cv2.IMREAD_COLOR) for file in files]
+        if snapshots:
+            for snapshot in CandidateSnapshot.objects.exclude(image='').exclude(image=None).order_by('-id')[:snapshots]:
+                images.append(read_image(snapshot.image))
+        return [image for image in images if image is not None]
+
+    @staticmethod
+    def run(detector, images, workers, warmup):
+        """
+        Returns the number of faces detected in each image, the latency of each image and the total time (seconds).
+        """
+        for image in images[:warmup]:
+            detector.get(image)
+
+        def detect(image):
+            start = time.perf_counter()
+            count = len(detector.get(image))
+            return count, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(detect, images))
+        elapsed = time.perf_counter() - start
+
+        return [count for count, _ in results], [latency for _, latency in results], elapsed
@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand, CommandError
+
+from core.models import Assessment
+from core.reports import submissions_count, submissions_zip_chunks
+
+
+class Command(BaseCommand):
+    help = "Exports the code of all the submissions of the submitted attempts of an assessment to a ZIP file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('assessment_id', type=int, help="id of the assessment")
+        parser.add_argument('output', help="path of the ZIP file")
+
+    def handle(self, *args, **options):
+        self.stdout.write('Running export submissions management command')
+
+        assessment = Assessment.objects.select_related('course').filter(id=options['assessment_id']).first()
+        if assessment is None:
+            raise CommandError(f"Assessment {options['assessment_id']} does not exist.")
+
+        self.stdout.write(f'[1] Exporting {submissions_count(assessment)} submissions of {assessment.name}:')
+        size = 0
+        with open(options['output'], 'wb') as file:
+            # written as the submissions are read, the archive is never held in memory
+            for chunk in submissions_zip_chunks(assessment):
+                file.write(chunk)
+                size += len(chunk)
+        self.stdout.write(f'  - {options["output"]} ({size / 1024:.1f} KB)')
+
+        self.stdout.write(self.style.SUCCESS('\nSuccessfully completed export_submissions!'))
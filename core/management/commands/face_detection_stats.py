@@ -0,0 +1,47 @@
+from django.core.management import BaseCommand
+from django.db.models import Count, Q
+
+from core.models import CandidateSnapshot
+
+
+class Command(BaseCommand):
+    help = "Reports the face detection of the candidate snapshots of each assessment: snapshots detected, near-duplicates " \
+           "whose detection was skipped (see SNAPSHOT_DUPLICATE_THRESHOLD), invalid images and pending snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assessment', type=int, nargs='+', help="ids of the assessments (default: all)")
+
+    def handle(self, *args, **options):
+        self.stdout.write('Running face detection stats management command')
+
+        snapshots = CandidateSnapshot.objects.all()
+        if options['assessment']:
+            snapshots = snapshots.filter(assessment_attempt__assessment_id__in=options['assessment'])
+
+        # counts of each assessment, from a single grouped query
+        rows = snapshots.values('assessment_attempt__assessment_id', 'assessment_attempt__assessment__name') \
+            .annotate(total=Count('id'),
+                      done=Count('id', filter=Q(faces_detected__isnull=False)),
+                      skipped=Count('id', filter=Q(detection_skipped=True)),
+                      failed=Count('id', filter=Q(detection_failed=True)),
+                      pending=Count('id', filter=Q(faces_detected__isnull=True, detection_failed=False))) \
+            .order_by('assessment_attempt__assessment_id')
+
+        self.stdout.write('[1] Snapshots of each assessment:')
+        self.stdout.write(f'  {"assessment":<40} {"snapshots":>10} {"detected":>10} {"skipped":>10} {"skip rate":>10} '
+                          f'{"invalid":>8} {"pending":>8}')
+        totals = {'total': 0, 'done': 0, 'skipped': 0, 'failed': 0, 'pending': 0}
+        for row in rows:
+            for key in totals:
+                totals[key] += row[key]
+            name = f"{row['assessment_attempt__assessment_id']} {row['assessment_attempt__assessment__name']}"[:40]
+            self.stdout.write(f'  {name:<40} {self.format_row(row)}')
+        self.stdout.write(f'  {"total":<40} {self.format_row(totals)}')
+
+        self.stdout.write(self.style.SUCCESS('\nSuccessfully completed face_detection_stats!'))
+
+    @staticmethod
+    def format_row(row):
+        # share of the completed snapshots whose result was copied from a near-duplicate
+        skip_rate = f"{row['skipped'] / row['done']:.1%}" if row['done'] else "-"
+        return f"{row['total']:>10} {row['done']:>10} {row['skipped']:>10} {skip_rate:>10} {row['failed']:>8} {row['pending']:>8}"
@@ -0,0 +1,48 @@
+from django.core.management import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from core.models import CodeQuestion, CodeQuestionAttempt, CodeQuestionSubmission, SubmissionFingerprint
+from core.plagiarism import index_question_attempt, similar_pairs
+
+
+class Command(BaseCommand):
+    help = "Indexes the fingerprints of the best submission of each code question attempt (plagiarism screening), " \
+           "then reports the most similar pairs of each code question"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assessment', type=int, nargs='+', help="ids of the assessments (default: all)")
+        parser.add_argument('--rebuild', action='store_true', help="index all question attempts again")
+        parser.add_argument('--top', type=int, default=10, help="pairs reported per code question (0: index only)")
+
+    def handle(self, *args, **options):
+        self.stdout.write('Running plagiarism screening management command')
+
+        questions = CodeQuestion.objects.filter(assessment__isnull=False).order_by('id')
+        if options['assessment']:
+            questions = questions.filter(assessment_id__in=options['assessment'])
+
+        # stage 1: index the best submissions that are not indexed yet (already indexed ones are skipped)
+        self.stdout.write('[1] Indexing:')
+        if options['rebuild']:
+            SubmissionFingerprint.objects.filter(code_question__in=questions).delete()
+        cq_attempts = CodeQuestionAttempt.objects.filter(code_question__in=questions) \
+            .filter(Exists(CodeQuestionSubmission.objects.filter(cq_attempt=OuterRef('pk'), score__isnull=False))) \
+            .only('id', 'code_question_id').order_by('id')
+        indexed = 0
+        for cq_attempt in cq_attempts.iterator():
+            indexed += index_question_attempt(cq_attempt)
+        self.stdout.write(f'  - {indexed} question attempts indexed')
+
+        # stage 2: most similar pairs of each question
+        if options['top']:
+            self.stdout.write('[2] Similar pairs:')
+            for question in questions.select_related('assessment'):
+                pairs = similar_pairs(question, limit=options['top'])
+                self.stdout.write(f'  {question.assessment.name} / {question.name}: {len(pairs)} pairs')
+                for pair in pairs:
+                    first, second = pair['attempts']
+                    self.stdout.write(f'    - {first["username"]} (submission {first["cq_submission_id"]}) / '
+                                      f'{second["username"]} (submission {second["cq_submission_id"]}): '
+                                      f'{pair["overlap"]:.0%} overlap, {pair["shared"]} shared fingerprints')
+
+        self.stdout.write(self.style.SUCCESS('\nSuccessfully completed plagiarism_screening!'))
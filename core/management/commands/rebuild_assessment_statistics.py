@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+
+from core.models import Assessment, AssessmentStatistics
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the statistics of the assessment reports from the scored attempts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assessment', type=int, nargs='+', help="ids of the assessments to rebuild (default: all)")
+
+    def handle(self, *args, **options):
+        self.stdout.write('Running rebuild assessment statistics management command')
+
+        assessments = Assessment.objects.order_by('id')
+        if options['assessment']:
+            assessments = assessments.filter(id__in=options['assessment'])
+
+        self.stdout.write('[1] Assessment statistics:')
+        for assessment in assessments.iterator():
+            statistics = AssessmentStatistics.rebuild(assessment)
+            self.stdout.write(f'  - {assessment.id} {assessment.name}: {statistics.attempts_count} attempts, '
+                              f'{statistics.candidates_count} candidates')
+
+        self.stdout.write(self.style.SUCCESS('\nSuccessfully completed rebuild_assessment_statistics!'))
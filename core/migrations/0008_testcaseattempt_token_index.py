@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_hdl_update_data'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='testcaseattempt',
+            name='token',
+            field=models.CharField(db_index=True, max_length=36),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_testcaseattempt_token_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='testcaseattempt',
+            index=models.Index(condition=models.Q(('status__in', [1, 2])), fields=['status'], name='testcaseattempt_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_testcaseattempt_pending_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Judge0Result',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('token', models.CharField(db_index=True, max_length=36)),
+                ('status', models.IntegerField(choices=[(1, 'In Queue'), (2, 'Processing'), (3, 'Accepted'), (4, 'Wrong Answer'), (5, 'Time Limit Exceeded'), (6, 'Compilation Error'), (7, 'Runtime Error (SIGSEGV)'), (8, 'Runtime Error (SIGXFSZ)'), (9, 'Runtime Error (SIGFPE)'), (10, 'Runtime Error (SIGABRT)'), (11, 'Runtime Error (NZEC)'), (12, 'Runtime Error (Other)'), (13, 'Internal Error'), (14, 'Exec Format Error')], default=1)),
+                ('stdout', models.TextField(blank=True, null=True)),
+                ('time', models.FloatField(blank=True, null=True)),
+                ('memory', models.FloatField(blank=True, null=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='testcaseattempt',
+            name='digest',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:36
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+class Migration(migrations.Migration):
+
+    # scores of the processed submissions and best scores of the question attempts, see the backfill_scores command
+    def fill_scores(apps, schema_editor):
+        CodeQuestionAttempt = apps.get_model('core', 'CodeQuestionAttempt')
+        CodeQuestionSubmission = apps.get_model('core', 'CodeQuestionSubmission')
+        TestCaseAttempt = apps.get_model('core', 'TestCaseAttempt')
+
+        accepted_score = TestCaseAttempt.objects.filter(cq_submission=OuterRef('pk'), status=3) \
+            .order_by().values('cq_submission').annotate(total=Sum('test_case__score')).values('total')
+        CodeQuestionSubmission.objects.filter(passed__isnull=False) \
+            .update(score=Coalesce(Subquery(accepted_score), 0))
+
+        best_score = CodeQuestionSubmission.objects.filter(cq_attempt=OuterRef('pk'), score__isnull=False) \
+            .order_by().values('cq_attempt').annotate(best=Max('score')).values('best')
+        CodeQuestionAttempt.objects.update(best_score=Coalesce(Subquery(best_score), 0))
+
+    dependencies = [
+        ('core', '0010_judge0result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='codequestionattempt',
+            name='best_score',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='codequestionsubmission',
+            name='score',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
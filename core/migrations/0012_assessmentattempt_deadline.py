@@ -0,0 +1,40 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:37
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # deadline of the attempts that are still open (see AssessmentAttempt.compute_deadline)
+    def fill_deadlines(apps, schema_editor):
+        AssessmentAttempt = apps.get_model('core', 'AssessmentAttempt')
+
+        open_attempts = list(AssessmentAttempt.objects.filter(time_submitted__isnull=True).select_related('assessment'))
+        for attempt in open_attempts:
+            deadlines = []
+            if attempt.assessment.duration != 0:
+                deadlines.append(attempt.time_started + timedelta(minutes=attempt.assessment.duration))
+            if attempt.assessment.time_end:
+                deadlines.append(attempt.assessment.time_end)
+            attempt.deadline = min(deadlines) + timedelta(seconds=30) if deadlines else None
+
+        AssessmentAttempt.objects.bulk_update(open_attempts, ['deadline'])
+
+    dependencies = [
+        ('core', '0011_submission_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assessmentattempt',
+            name='deadline',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='assessmentattempt',
+            index=models.Index(condition=models.Q(('time_submitted__isnull', True)), fields=['deadline'], name='assessmentattempt_deadline_idx'),
+        ),
+        migrations.RunPython(fill_deadlines, migrations.RunPython.noop),
+    ]
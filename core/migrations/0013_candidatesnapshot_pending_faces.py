@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_assessmentattempt_deadline'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='candidatesnapshot',
+            name='faces_detected',
+            field=models.PositiveIntegerField(blank=True, default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:40
+
+import core.models.attempts
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_candidatesnapshot_pending_faces'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candidatesnapshot',
+            name='original',
+            field=models.ImageField(blank=True, null=True, upload_to=core.models.attempts.snapshots_directory_path),
+        ),
+        migrations.AddField(
+            model_name='candidatesnapshot',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to=core.models.attempts.snapshots_directory_path),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_candidatesnapshot_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candidatesnapshot',
+            name='detection_skipped',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='candidatesnapshot',
+            name='image_hash',
+            field=models.CharField(blank=True, max_length=16, null=True),
+        ),
+    ]
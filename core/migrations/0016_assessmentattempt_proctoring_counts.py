@@ -0,0 +1,39 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:42
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+class Migration(migrations.Migration):
+
+    # counts of the snapshots that have already been detected
+    def fill_proctoring_counts(apps, schema_editor):
+        AssessmentAttempt = apps.get_model('core', 'AssessmentAttempt')
+        CandidateSnapshot = apps.get_model('core', 'CandidateSnapshot')
+
+        counts = CandidateSnapshot.objects.values('assessment_attempt_id').annotate(
+            multiple_faces=Count('id', filter=Q(faces_detected__gt=1) & ~Q(image__contains="initial")),
+            no_faces=Count('id', filter=Q(faces_detected=0)),
+        ).filter(Q(multiple_faces__gt=0) | Q(no_faces__gt=0))
+
+        attempts = [AssessmentAttempt(id=count['assessment_attempt_id'], multiple_faces_count=count['multiple_faces'],
+                                      no_faces_count=count['no_faces']) for count in counts]
+        AssessmentAttempt.objects.bulk_update(attempts, ['multiple_faces_count', 'no_faces_count'], batch_size=1000)
+
+    dependencies = [
+        ('core', '0015_candidatesnapshot_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assessmentattempt',
+            name='multiple_faces_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='assessmentattempt',
+            name='no_faces_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_proctoring_counts, migrations.RunPython.noop),
+    ]
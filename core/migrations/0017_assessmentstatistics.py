@@ -0,0 +1,27 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_assessmentattempt_proctoring_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssessmentStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts_count', models.PositiveIntegerField(default=0)),
+                ('candidates_count', models.PositiveIntegerField(default=0)),
+                ('score_counts', models.JSONField(default=dict)),
+                ('question_stats', models.JSONField(default=dict)),
+                ('test_case_stats', models.JSONField(default=dict)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('assessment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='statistics', to='core.assessment')),
+            ],
+        ),
+    ]
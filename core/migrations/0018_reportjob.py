@@ -0,0 +1,42 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:53
+
+import core.models.reports
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_assessmentstatistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assessmentstatistics',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report', models.CharField(choices=[('results', 'Results (CSV)'), ('breakdown', 'Question breakdown (CSV)'), ('breakdown_test_cases', 'Question and test case breakdown (CSV)'), ('breakdown_json', 'Question and test case breakdown (JSON)')], max_length=30)),
+                ('data_version', models.PositiveIntegerField()),
+                ('status', models.IntegerField(choices=[(1, 'Pending'), (2, 'Running'), (3, 'Done'), (4, 'Failed')], default=1)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('file', models.FileField(blank=True, null=True, upload_to=core.models.reports.reports_directory_path)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('time_created', models.DateTimeField(auto_now_add=True)),
+                ('time_finished', models.DateTimeField(blank=True, null=True)),
+                ('assessment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.assessment')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='reportjob',
+            constraint=models.UniqueConstraint(fields=('assessment', 'report', 'data_version'), name='reportjob_version_unique'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # file extensions of the existing languages, from their editor mode
+    def fill_file_extensions(apps, schema_editor):
+        Language = apps.get_model('core', 'Language')
+        extensions = {'c_cpp': 'c', 'java': 'java', 'python': 'py', 'verilog': 'v'}
+
+        for language in Language.objects.all():
+            if language.ace_mode == 'c_cpp' and 'C++' in language.name:
+                language.file_extension = 'cpp'
+            else:
+                language.file_extension = extensions.get(language.ace_mode, 'txt')
+            language.save(update_fields=['file_extension'])
+
+    dependencies = [
+        ('core', '0018_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='language',
+            name='file_extension',
+            field=models.CharField(default='txt', max_length=10),
+        ),
+        migrations.RunPython(fill_file_extensions, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='reportjob',
+            name='report',
+            field=models.CharField(choices=[('results', 'Results (CSV)'), ('breakdown', 'Question breakdown (CSV)'), ('breakdown_test_cases', 'Question and test case breakdown (CSV)'), ('breakdown_json', 'Question and test case breakdown (JSON)'), ('submissions', 'Submitted code (ZIP)')], max_length=30),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.3 on 2026-10-18 19:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_language_file_extension'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.BigIntegerField()),
+                ('code_question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.codequestion')),
+                ('cq_attempt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.codequestionattempt')),
+                ('cq_submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.codequestionsubmission')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='submissionfingerprint',
+            index=models.Index(fields=['code_question', 'hash'], name='fingerprint_question_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.3 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_submissionfingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='time_updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
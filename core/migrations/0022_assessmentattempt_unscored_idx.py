@@ -0,0 +1,17 @@
+# Generated by Django 4.0.3 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_reportjob_time_updated'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assessmentattempt',
+            index=models.Index(condition=models.Q(('score__isnull', True), ('time_submitted__isnull', False)), fields=['time_submitted'], name='assessmentattempt_unscored_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.0.3 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_assessmentattempt_unscored_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candidatesnapshot',
+            name='detection_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='candidatesnapshot',
+            name='detection_failed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='candidatesnapshot',
+            index=models.Index(condition=models.Q(('detection_failed', False), ('faces_detected__isnull', True)), fields=['id'], name='candidatesnapshot_pending_idx'),
+        ),
+    ]
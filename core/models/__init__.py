@@ -1,4 +1,7 @@
-from .assessments import Assessment
+from .assessments import Assessment, AssessmentStatistics
 from .users_management import User, Course, CourseGroup
 from .questions import QuestionBank, CodeQuestion, Tag, TestCase, Language, CodeSnippet, CodeTemplate
-from .attempts import AssessmentAttempt, CodeQuestionAttempt, CodeQuestionSubmission, TestCaseAttempt, CandidateSnapshot
+from .attempts import AssessmentAttempt, CodeQuestionAttempt, CodeQuestionSubmission, TestCaseAttempt, CandidateSnapshot, \
+    Judge0Result
+from .reports import ReportJob
+from .plagiarism import SubmissionFingerprint
@@ -1,6 +1,8 @@
+from math import ceil
+
 from django.apps import apps
-from django.db import models
-from django.db.models import Sum
+from django.db import models, transaction
+from django.db.models import Count, Exists, OuterRef, Q, Subquery, Sum
 from django.utils import timezone
 
 
@@ -63,4 +65,209 @@ class Assessment(models.Model):
         TestCase = apps.get_model(app_label="core", model_name="TestCase")
         total_score = TestCase.objects.filter(code_question__assessment=self).aggregate(Sum('score')).get("score__sum", 0)
         return total_score
- 
\ No newline at end of file
+ 
+
+def _attempts_statistics(attempts):
+    """
+    Returns the statistics of a queryset of scored AssessmentAttempts, in the format of the AssessmentStatistics fields:
+    (score_counts, question_stats, test_case_stats).
+    """
+    CodeQuestionAttempt = apps.get_model(app_label="core", model_name="CodeQuestionAttempt")
+    CodeQuestionSubmission = apps.get_model(app_label="core", model_name="CodeQuestionSubmission")
+    TestCase = apps.get_model(app_label="core", model_name="TestCase")
+    TestCaseAttempt = apps.get_model(app_label="core", model_name="TestCaseAttempt")
+
+    # number of attempts of each score
+    score_counts = {str(row["score"]): row["count"] for row in attempts.values("score").annotate(count=Count("id"))}
+
+    # question attempts with at least one processed submission, and with the full score of the question
+    max_scores = dict(TestCase.objects.filter(code_question__assessment_id__in=attempts.values("assessment_id"))
+                      .values_list("code_question_id").annotate(max_score=Sum("score")))
+    question_stats = {}
+    question_attempts = CodeQuestionAttempt.objects.filter(assessment_attempt__in=attempts) \
+        .annotate(submitted=Exists(CodeQuestionSubmission.objects.filter(cq_attempt=OuterRef("pk"), score__isnull=False))) \
+        .values("code_question_id", "best_score", "submitted").annotate(count=Count("id"))
+    for row in question_attempts:
+        stats = question_stats.setdefault(str(row["code_question_id"]), {"submitted": 0, "passed": 0})
+        if row["submitted"]:
+            stats["submitted"] += row["count"]
+            if row["best_score"] >= max_scores.get(row["code_question_id"], 0):
+                stats["passed"] += row["count"]
+
+    # accepted test cases in the best submission of each question attempt (the latest one if several have the best score)
+    best_submission = CodeQuestionSubmission.objects.filter(cq_attempt=OuterRef("cq_submission__cq_attempt"),
+                                                            score__isnull=False) \
+        .order_by("-score", "-id").values("id")[:1]
+    test_case_stats = {str(test_case_id): accepted for test_case_id, accepted in TestCaseAttempt.objects
+                       .filter(cq_submission__cq_attempt__assessment_attempt__in=attempts, cq_submission=Subquery(best_submission))
+                       .values_list("test_case_id").annotate(accepted=Count("id", filter=Q(status=3)))}
+
+    return score_counts, question_stats, test_case_stats
+
+
+def _add_counts(counts, other, sign=1):
+    """
+    Adds (or subtracts with sign=-1) the counts of other to counts, both dicts of counts or of dicts of counts.
+    """
+    for key, value in other.items():
+        if isinstance(value, dict):
+            _add_counts(counts.setdefault(key, {}), value, sign)
+        else:
+            counts[key] = counts.get(key, 0) + sign * value
+
+
+class AssessmentStatistics(models.Model):
+    """
+    Statistics of the best attempt of each candidate of an Assessment, for the assessment report.
+    Updated as each attempt is scored (see AssessmentAttempt.compute_score), rebuilt from the attempts with rebuild() or
+    the rebuild_assessment_statistics management command.
+    """
+    assessment = models.OneToOneField(Assessment, null=False, blank=False, on_delete=models.CASCADE, related_name="statistics")
+    attempts_count = models.PositiveIntegerField(default=0)  # scored attempts
+    candidates_count = models.PositiveIntegerField(default=0)  # candidates with a scored attempt (best attempts)
+    score_counts = models.JSONField(default=dict)  # {score: number of best attempts}
+    question_stats = models.JSONField(default=dict)  # {code question id: {"submitted": n, "passed": n}}
+    test_case_stats = models.JSONField(default=dict)  # {test case id: number of best attempts that passed it}
+    version = models.PositiveIntegerField(default=0)  # incremented each time the statistics change, see ReportJob
+    last_updated = models.DateTimeField(auto_now=True)
+
+    # number of bins of the score histogram
+    HISTOGRAM_BINS = 10
+
+    @classmethod
+    def for_assessment(cls, assessment):
+        """
+        Returns the statistics of the assessment, built from its attempts if they do not exist yet.
+        """
+        statistics = cls.objects.filter(assessment=assessment).first()
+        if statistics is None:
+            statistics = cls.rebuild(assessment)
+        return statistics
+
+    @classmethod
+    def rebuild(cls, assessment):
+        """
+        Recomputes the statistics of the assessment from all its scored attempts.
+        """
+        AssessmentAttempt = apps.get_model(app_label="core", model_name="AssessmentAttempt")
+
+        # the row is created first, so that the attempts scored during the rebuild update it once it is done
+        cls.objects.get_or_create(assessment_id=assessment.id)
+        with transaction.atomic():
+            statistics = cls.objects.select_for_update().get(assessment=assessment)
+            scored_attempts = AssessmentAttempt.objects.filter(assessment=assessment, score__isnull=False)
+            best_attempts = scored_attempts.filter(best_attempt=True)
+
+            statistics.attempts_count = scored_attempts.count()
+            statistics.candidates_count = best_attempts.count()
+            statistics.score_counts, statistics.question_stats, statistics.test_case_stats = _attempts_statistics(best_attempts)
+            statistics.version += 1
+            statistics.save()
+        return statistics
+
+    @classmethod
+    def record_score(cls, attempt, replaced_attempt=None, first_score=True):
+        """
+        Updates the statistics of the assessment of a newly scored attempt, within the transaction of its score.
+        replaced_attempt is the previous best attempt of the candidate if this attempt replaces it, first_score is False if
+        the attempt had already been scored. Assessments without statistics yet are skipped, they are built on first use.
+        The contributions of the attempts are computed before the statistics row is locked, so that the attempts scored
+        at the same time only wait for each other to add them.
+        """
+        AssessmentAttempt = apps.get_model(app_label="core", model_name="AssessmentAttempt")
+        if not cls.objects.filter(assessment_id=attempt.assessment_id).exists():
+            return
+
+        if not first_score:
+            # the previous contributions of a rescored attempt are unknown, the statistics are rebuilt in the background
+            # once the score is committed (imported here, core.tasks imports the models)
+            from core.tasks import rebuild_assessment_statistics
+            transaction.on_commit(lambda: rebuild_assessment_statistics.delay(attempt.assessment_id))
+            return
+
+        added = removed = None
+        if attempt.best_attempt:
+            added = _attempts_statistics(AssessmentAttempt.objects.filter(id=attempt.id))
+            if replaced_attempt is not None:
+                # the contributions of the previous best attempt are replaced by the ones of this attempt
+                removed = _attempts_statistics(AssessmentAttempt.objects.filter(id=replaced_attempt.id))
+
+        with transaction.atomic():
+            statistics = cls.objects.select_for_update().get(assessment_id=attempt.assessment_id)
+            counts = (statistics.score_counts, statistics.question_stats, statistics.test_case_stats)
+
+            statistics.attempts_count += 1
+            if attempt.best_attempt and removed is None:
+                statistics.candidates_count += 1
+            for field_counts, attempt_counts in zip(counts, removed or ()):
+                _add_counts(field_counts, attempt_counts, sign=-1)
+            for field_counts, attempt_counts in zip(counts, added or ()):
+                _add_counts(field_counts, attempt_counts)
+
+            statistics.version += 1
+            statistics.save()
+
+    def scores(self):
+        """
+        Scores of the best attempts, sorted (one item per score value: (score, number of attempts)).
+        """
+        return sorted((int(score), count) for score, count in self.score_counts.items() if count > 0)
+
+    def percentile(self, percent):
+        """
+        Score below which percent % of the best attempts are (nearest rank), None if there are no attempts.
+        """
+        total = sum(count for _, count in self.scores())
+        if total == 0:
+            return None
+        rank = max(1, ceil(percent / 100 * total))
+        seen = 0
+        for score, count in self.scores():
+            seen += count
+            if seen >= rank:
+                return score
+
+    @property
+    def mean(self):
+        scores = self.scores()
+        total = sum(count for _, count in scores)
+        return round(sum(score * count for score, count in scores) / total, 2) if total else None
+
+    @property
+    def median(self):
+        return self.percentile(50)
+
+    def histogram(self):
+        """
+        Number of best attempts in each of the HISTOGRAM_BINS score ranges of the assessment: [(low, high, count)].
+        """
+        total_score = self.assessment.total_score or 0
+        width = max(1, ceil((total_score + 1) / self.HISTOGRAM_BINS))
+        bins = [[low, min(low + width - 1, total_score), 0] for low in range(0, total_score + 1, width)]
+        for score, count in self.scores():
+            bins[min(score // width, len(bins) - 1)][2] += count
+        return [tuple(b) for b in bins]
+
+    def questions(self):
+        """
+        Statistics of each code question of the assessment and its test cases, with their pass rates.
+        """
+        CodeQuestion = apps.get_model(app_label="core", model_name="CodeQuestion")
+
+        def rate(count):
+            return round(count / self.candidates_count * 100, 1) if self.candidates_count else None
+
+        questions = []
+        for question in CodeQuestion.objects.filter(assessment_id=self.assessment_id).prefetch_related("testcase_set").order_by("id"):
+            stats = self.question_stats.get(str(question.id), {})
+            test_cases = [{"test_case": test_case, "passed": self.test_case_stats.get(str(test_case.id), 0),
+                           "pass_rate": rate(self.test_case_stats.get(str(test_case.id), 0))}
+                          for test_case in sorted(question.testcase_set.all(), key=lambda test_case: test_case.id)]
+            questions.append({
+                "question": question,
+                "submitted": stats.get("submitted", 0),
+                "passed": stats.get("passed", 0),
+                "pass_rate": rate(stats.get("passed", 0)),
+                "test_cases": test_cases,
+            })
+        return questions
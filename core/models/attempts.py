@@ -1,9 +1,24 @@
+from datetime import timedelta
+
 from django.apps import apps
-from django.db import models
-from django.db.models import Sum
+from django.db import models, transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
 
 
 class AssessmentAttempt(models.Model):
+    class Meta:
+        indexes = [
+            # for finding the overdue attempts to be submitted
+            models.Index(fields=['deadline'], condition=Q(time_submitted__isnull=True), name='assessmentattempt_deadline_idx'),
+            # for finding the submitted attempts that have not been scored
+            models.Index(fields=['time_submitted'], condition=Q(time_submitted__isnull=False, score__isnull=True),
+                         name='assessmentattempt_unscored_idx'),
+        ]
+
+    # grace period after the end of the duration/assessment, before the attempt is automatically submitted
+    DEADLINE_GRACE_PERIOD = timedelta(seconds=30)
+
     candidate = models.ForeignKey("User", null=False, blank=False, on_delete=models.PROTECT)
     assessment = models.ForeignKey("Assessment", null=False, blank=False, on_delete=models.PROTECT)
     time_started = models.DateTimeField(auto_now_add=True)
@@ -11,6 +26,21 @@ class AssessmentAttempt(models.Model):
     auto_submit = models.BooleanField(blank=True, null=True)
     score = models.PositiveIntegerField(blank=True, null=True)
     best_attempt = models.BooleanField(blank=True, null=True)
+    deadline = models.DateTimeField(blank=True, null=True)  # null if no time limit
+    multiple_faces_count = models.PositiveIntegerField(default=0)  # snapshots with multiple faces (except initial snapshot)
+    no_faces_count = models.PositiveIntegerField(default=0)  # snapshots without faces
+
+    def compute_deadline(self):
+        """
+        Returns the time that this attempt is automatically submitted: the end of the duration or the end of the assessment,
+        whichever is earlier (plus the grace period). None if the assessment has unlimited duration and no end time.
+        """
+        deadlines = []
+        if self.assessment.duration != 0:
+            deadlines.append(self.time_started + timedelta(minutes=self.assessment.duration))
+        if self.assessment.time_end:
+            deadlines.append(self.assessment.time_end)
+        return min(deadlines) + self.DEADLINE_GRACE_PERIOD if deadlines else None
 
     def status(self):
         if self.time_started and not self.time_submitted:
@@ -24,40 +54,42 @@ class AssessmentAttempt(models.Model):
             return "Finished"
 
     def compute_score(self):
-        TestCase = apps.get_model(app_label="core", model_name="TestCase")
-
+        """
+        Computes the total score of this AssessmentAttempt (sum of the best submission score of each CodeQuestionAttempt),
+        then determines if it is the best attempt of the candidate.
+        """
         # compute the total score of all CodeQuestionAttempts (i.e. total score of this AssessmentAttempt)
-        total_score = 0
-        for cqa in self.codequestionattempt_set.all():
-            # find the max CodeQuestionSubmission for this CodeQuestionAttempt
-            max_score = 0
-            for cqs in CodeQuestionSubmission.objects.filter(cq_attempt=cqa):
-                cqs_score = TestCase.objects.filter(testcaseattempt__cq_submission=cqs, testcaseattempt__status=3).aggregate(Sum('score')).get(
-                    "score__sum")
-                cqs_score = cqs_score if cqs_score else 0
-                if cqs_score > max_score:
-                    max_score = cqs_score
-
-            # add to total
-            total_score += max_score
+        total_score = CodeQuestionAttempt.objects.filter(assessment_attempt=self) \
+            .aggregate(total_score=Coalesce(Sum('best_score'), 0)).get("total_score")
 
         self.score = total_score
 
-        # get the previous best attempt
-        prev_best_attempt = AssessmentAttempt.objects.filter(candidate=self.candidate, assessment=self.assessment, best_attempt=True).first()
+        with transaction.atomic():
+            # lock the attempts of the candidate, so that concurrent computations cannot flip the best attempt at the same time
+            attempts = AssessmentAttempt.objects.select_for_update() \
+                .filter(candidate_id=self.candidate_id, assessment_id=self.assessment_id).only('id', 'score', 'best_attempt')
 
-        # check the previous_best_attempt
-        if prev_best_attempt:
-            if self.score > prev_best_attempt.score:
-                prev_best_attempt.best_attempt = False
-                prev_best_attempt.save()
-                self.best_attempt = True
+            # get the previous best attempt
+            prev_best_attempt = next((attempt for attempt in attempts if attempt.best_attempt and attempt.id != self.id), None)
+            first_score = next((attempt.score is None for attempt in attempts if attempt.id == self.id), True)
+
+            # check the previous_best_attempt
+            replaced_attempt = None
+            if prev_best_attempt:
+                if self.score > prev_best_attempt.score:
+                    AssessmentAttempt.objects.filter(id=prev_best_attempt.id).update(best_attempt=False)
+                    self.best_attempt = True
+                    replaced_attempt = prev_best_attempt
+                else:
+                    self.best_attempt = False
             else:
-                self.best_attempt = False
-        else:
-            self.best_attempt = True
+                self.best_attempt = True
+
+            self.save(update_fields=['score', 'best_attempt'])
 
-        self.save()
+            # update the statistics of the assessment report
+            AssessmentStatistics = apps.get_model(app_label="core", model_name="AssessmentStatistics")
+            AssessmentStatistics.record_score(self, replaced_attempt=replaced_attempt, first_score=first_score)
 
     def has_processing_submission(self):
         """
@@ -65,17 +97,21 @@ class AssessmentAttempt(models.Model):
         """
         return CodeQuestionSubmission.objects.filter(cq_attempt__assessment_attempt=self, passed=None).exists()
 
-    @property
-    def duration(self):
-        if self.time_submitted is None:
+    @staticmethod
+    def format_duration(time_started, time_submitted):
+        if time_submitted is None:
             return None
-        seconds = (self.time_submitted - self.time_started).total_seconds()
+        seconds = (time_submitted - time_started).total_seconds()
 
         if seconds < 60:
             return f"{round(seconds)} sec"
         else:
             return f"{round(seconds/60)} min"
 
+    @property
+    def duration(self):
+        return self.format_duration(self.time_started, self.time_submitted)
+
     @property
     def total_attempts(self):
         return AssessmentAttempt.objects.filter(assessment=self.assessment, candidate=self.candidate).count()
@@ -83,29 +119,22 @@ class AssessmentAttempt(models.Model):
     @property
     def multiple_faces_detected(self):
         if self.assessment.require_webcam:
-            snapshots = CandidateSnapshot.objects.filter(assessment_attempt=self, assessment_attempt__candidate=self.candidate)
-            for snapshot in snapshots:
-                if "initial" not in snapshot.image.name and snapshot.faces_detected > 1:
-                    return True
-            return False
-        
+            return self.multiple_faces_count > 0
+
         return None
 
     @property
     def no_faces_detected(self):
         if self.assessment.require_webcam:
-            snapshots = CandidateSnapshot.objects.filter(assessment_attempt=self, assessment_attempt__candidate=self.candidate)
-            for snapshot in snapshots:
-                if snapshot.faces_detected == 0:
-                    return True
-            return False
-        
+            return self.no_faces_count > 0
+
         return None
 
 
 class CodeQuestionAttempt(models.Model):
     assessment_attempt = models.ForeignKey("AssessmentAttempt", null=False, blank=False, on_delete=models.CASCADE)
     code_question = models.ForeignKey("CodeQuestion", null=False, blank=False, on_delete=models.PROTECT)
+    best_score = models.PositiveIntegerField(default=0)  # max score of the processed submissions
 
     @property
     def attempted(self):
@@ -121,6 +150,7 @@ class CodeQuestionSubmission(models.Model):
     passed = models.BooleanField(blank=True, null=True)
     language = models.ForeignKey("Language", null=False, blank=False, on_delete=models.PROTECT)
     code = models.TextField()
+    score = models.PositiveIntegerField(blank=True, null=True)  # None while processing
 
     @property
     def outcome(self):
@@ -131,8 +161,11 @@ class CodeQuestionSubmission(models.Model):
         elif not self.passed:
             return "Failed"
 
-    @property
-    def score(self):
+    def compute_score(self):
+        """
+        Computes the score of this submission (sum of the scores of its accepted test cases).
+        Only called once all test cases have been processed, the score is stored in the score field.
+        """
         TestCase = apps.get_model(app_label="core", model_name="TestCase")
         cqs_score = TestCase.objects.filter(testcaseattempt__cq_submission=self, testcaseattempt__status=3).aggregate(Sum('score')).get("score__sum")
         cqs_score = cqs_score if cqs_score else 0
@@ -140,6 +173,12 @@ class CodeQuestionSubmission(models.Model):
 
 
 class TestCaseAttempt(models.Model):
+    class Meta:
+        indexes = [
+            # for finding the pending test case attempts to be polled
+            models.Index(fields=['status'], condition=Q(status__in=[1, 2]), name='testcaseattempt_pending_idx'),
+        ]
+
     STATUSES = [
         (1, "In Queue"),
         (2, "Processing"),
@@ -159,11 +198,31 @@ class TestCaseAttempt(models.Model):
 
     cq_submission = models.ForeignKey("CodeQuestionSubmission", null=False, blank=False, on_delete=models.CASCADE)
     test_case = models.ForeignKey("TestCase", null=False, blank=False, on_delete=models.PROTECT)
-    token = models.CharField(max_length=36, null=False, blank=False)
+    token = models.CharField(max_length=36, null=False, blank=False, db_index=True)
     status = models.IntegerField(choices=STATUSES, default=1)
     stdout = models.TextField(blank=True, null=True)
     time = models.FloatField(blank=True, null=True)
     memory = models.FloatField(blank=True, null=True)
+    digest = models.CharField(max_length=64, null=True, blank=True)  # see core.judge0.submission_digest
+
+
+class Judge0Result(models.Model):
+    """
+    Result of a judge0 submission, keyed by the digest of the submission parameters (see core.judge0.submission_digest).
+    Identical submissions (same language, code, test case and limits) reuse the result instead of being executed again.
+    A result that is still pending (In Queue/Processing) belongs to a "Compile and Run" submission that has not finished yet.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    token = models.CharField(max_length=36, null=False, blank=False, db_index=True)
+    status = models.IntegerField(choices=TestCaseAttempt.STATUSES, default=1)
+    stdout = models.TextField(blank=True, null=True)
+    time = models.FloatField(blank=True, null=True)
+    memory = models.FloatField(blank=True, null=True)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    @property
+    def finished(self):
+        return self.status not in [1, 2]
 
 
 def snapshots_directory_path(instance, filename):
@@ -174,13 +233,33 @@ def snapshots_directory_path(instance, filename):
     course = assessment.course.short_name.replace(' ', '_').replace('/', '-')
     test_name = assessment.name.replace(' ', '_')
 
-    # file will be uploaded to MEDIA_ROOT/<course>/<test_name>/<username>/<attempt_number>/<filename>
+    # file will be uploaded to <storage>/<course>/<test_name>/<username>/<attempt_number>/<filename>
     return '{0}/{1}/{2}/attempt_{3}/{4}'.format(course, test_name, username, attempt_number, filename)
 
 
 class CandidateSnapshot(models.Model):
+    class Meta:
+        indexes = [
+            # for finding the pending snapshots to be detected
+            models.Index(fields=['id'], condition=Q(faces_detected__isnull=True, detection_failed=False),
+                         name='candidatesnapshot_pending_idx'),
+        ]
+
     assessment_attempt = models.ForeignKey("AssessmentAttempt", null=False, blank=False, on_delete=models.CASCADE)
     attempt_number = models.PositiveIntegerField(null=False, blank=False)
     timestamp = models.DateTimeField(null=False, blank=False)
-    image = models.ImageField(null=True, blank=True, upload_to=snapshots_directory_path)
-    faces_detected = models.PositiveIntegerField(default=0, null=False, blank=False)
+    image = models.ImageField(null=True, blank=True, upload_to=snapshots_directory_path)  # downscaled, see core.snapshots
+    thumbnail = models.ImageField(null=True, blank=True, upload_to=snapshots_directory_path)
+    original = models.ImageField(null=True, blank=True, upload_to=snapshots_directory_path)  # only if SNAPSHOT_KEEP_ORIGINAL
+    faces_detected = models.PositiveIntegerField(default=None, null=True, blank=True)  # None until detected
+    image_hash = models.CharField(max_length=16, null=True, blank=True)  # see core.snapshots.image_hash
+    detection_skipped = models.BooleanField(default=False)  # faces_detected copied from a near-duplicate snapshot
+    detection_failed = models.BooleanField(default=False)  # not a valid image, never detected (nor counted)
+    detection_claimed_at = models.DateTimeField(null=True, blank=True)  # being detected, see FACE_DETECTION_CLAIM_TIMEOUT
+
+    @property
+    def preview_url(self):
+        """
+        Url of the image shown in the review gallery (snapshots uploaded before thumbnails were generated have none)
+        """
+        return self.thumbnail.url if self.thumbnail else self.image.url
@@ -0,0 +1,18 @@
+from django.db import models
+
+
+class SubmissionFingerprint(models.Model):
+    """
+    Inverted index of the plagiarism screening (see core.plagiarism): one row per fingerprint of the best submission of
+    each CodeQuestionAttempt, the submissions of a code question sharing fingerprints are candidate pairs.
+    """
+    class Meta:
+        indexes = [
+            # for reading the index of a code question
+            models.Index(fields=['code_question', 'hash'], name='fingerprint_question_hash_idx'),
+        ]
+
+    code_question = models.ForeignKey("CodeQuestion", null=False, blank=False, on_delete=models.CASCADE)
+    cq_attempt = models.ForeignKey("CodeQuestionAttempt", null=False, blank=False, on_delete=models.CASCADE)
+    cq_submission = models.ForeignKey("CodeQuestionSubmission", null=False, blank=False, on_delete=models.CASCADE)
+    hash = models.BigIntegerField(null=False, blank=False)
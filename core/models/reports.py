@@ -0,0 +1,51 @@
+from django.db import models
+
+
+def reports_directory_path(instance, filename):
+    return f"reports/{instance.assessment_id}/{filename}"
+
+
+class ReportJob(models.Model):
+    """
+    Report of an assessment built in the background (see core.tasks.build_report) for a version of its data
+    (AssessmentStatistics.version). The file is kept and downloaded again until new attempts are scored.
+    """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['assessment', 'report', 'data_version'], name='reportjob_version_unique'),
+        ]
+
+    class Reports(models.TextChoices):
+        RESULTS = ('results', "Results (CSV)")
+        BREAKDOWN = ('breakdown', "Question breakdown (CSV)")
+        BREAKDOWN_TEST_CASES = ('breakdown_test_cases', "Question and test case breakdown (CSV)")
+        BREAKDOWN_JSON = ('breakdown_json', "Question and test case breakdown (JSON)")
+        SUBMISSIONS = ('submissions', "Submitted code (ZIP)")
+
+    class Statuses(models.IntegerChoices):
+        PENDING = (1, "Pending")
+        RUNNING = (2, "Running")
+        DONE = (3, "Done")
+        FAILED = (4, "Failed")
+
+    assessment = models.ForeignKey("Assessment", null=False, blank=False, on_delete=models.CASCADE)
+    report = models.CharField(max_length=30, choices=Reports.choices, null=False, blank=False)
+    data_version = models.PositiveIntegerField(null=False, blank=False)
+    status = models.IntegerField(choices=Statuses.choices, default=Statuses.PENDING)
+    processed = models.PositiveIntegerField(default=0)  # items (attempts or submissions) written to the file
+    total = models.PositiveIntegerField(default=0)  # items in the report
+    file = models.FileField(null=True, blank=True, upload_to=reports_directory_path)
+    error = models.TextField(null=True, blank=True)
+    created_by = models.ForeignKey("User", null=True, blank=True, on_delete=models.SET_NULL)
+    time_created = models.DateTimeField(auto_now_add=True)
+    time_finished = models.DateTimeField(null=True, blank=True)
+    time_updated = models.DateTimeField(auto_now=True)  # also set with the progress, see REPORT_JOB_TIMEOUT
+
+    @property
+    def progress(self):
+        """
+        Percentage of the items written to the file.
+        """
+        if self.status == self.Statuses.DONE:
+            return 100
+        return round(self.processed / self.total * 100) if self.total else 0
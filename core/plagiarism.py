@@ -0,0 +1,160 @@
+# plagiarism screening of the submitted code: winnowed k-gram fingerprints (see Schleimer et al., "Winnowing: local
+# algorithms for document fingerprinting") stored in an inverted index (SubmissionFingerprint)
+import hashlib
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from pygments.lexers import get_lexer_by_name, get_lexer_for_filename
+from pygments.token import Comment, Literal, Name, Text
+from pygments.util import ClassNotFound
+
+from core.models import CodeQuestionAttempt, CodeQuestionSubmission, CodeSnippet, SubmissionFingerprint
+
+# pygments lexers of the editor modes of the languages, other languages are found by their file extension
+LEXERS = {
+    "c_cpp": "cpp",
+    "java": "java",
+    "python": "python",
+    "verilog": "verilog",
+}
+
+# fingerprints of at most this number of attempts are never considered common code (small cohorts)
+MIN_COMMON_ATTEMPTS = 10
+
+
+def get_lexer(language):
+    try:
+        if language.ace_mode in LEXERS:
+            return get_lexer_by_name(LEXERS[language.ace_mode])
+        return get_lexer_for_filename(f"code.{language.file_extension}")
+    except ClassNotFound:
+        return get_lexer_by_name("text")
+
+
+def normalize(code, language) -> list:
+    """
+    Tokens of the code, without comments and whitespace. Identifiers and literals are replaced by their type, so that
+    renaming variables or changing constants does not change the fingerprints.
+    """
+    tokens = []
+    for token_type, value in get_lexer(language).get_tokens(code):
+        if token_type in Comment or token_type in Text or not value.strip():
+            continue
+        if token_type in Name:
+            tokens.append("N")
+        elif token_type in Literal:
+            tokens.append("L")
+        else:
+            tokens.append(value)
+    return tokens
+
+
+def fingerprints(tokens) -> set:
+    """
+    Winnowed fingerprints of a list of tokens: the minimum hash of each window of PLAGIARISM_WINDOW consecutive k-grams
+    (PLAGIARISM_KGRAM tokens). Any match of at least PLAGIARISM_KGRAM + PLAGIARISM_WINDOW - 1 tokens shares a fingerprint.
+    Hashes are signed 64 bits, stable across processes.
+    """
+    k, window = settings.PLAGIARISM_KGRAM, settings.PLAGIARISM_WINDOW
+    hashes = [int.from_bytes(hashlib.blake2b("\x1f".join(tokens[i:i + k]).encode(), digest_size=8).digest(), "big", signed=True)
+              for i in range(len(tokens) - k + 1)]
+    if len(hashes) <= window:
+        return {min(hashes)} if hashes else set()
+
+    selected = set()
+    for i in range(len(hashes) - window + 1):
+        selected.add(min(hashes[i:i + window]))
+    return selected
+
+
+def best_submission(cq_attempt_id):
+    """
+    Best processed submission of a question attempt, the latest one if several have the best score.
+    """
+    return CodeQuestionSubmission.objects.select_related("language") \
+        .filter(cq_attempt_id=cq_attempt_id, score__isnull=False).order_by("-score", "-id").first()
+
+
+def index_question_attempt(cq_attempt):
+    """
+    Replaces the fingerprints of a question attempt by the ones of its best submission, if it is not indexed yet.
+    Returns True if the index was updated.
+    """
+    submission = best_submission(cq_attempt.id)
+    if submission is None or SubmissionFingerprint.objects.filter(cq_submission=submission).exists():
+        return False
+
+    with transaction.atomic():
+        SubmissionFingerprint.objects.filter(cq_attempt=cq_attempt).delete()
+        SubmissionFingerprint.objects.bulk_create([
+            SubmissionFingerprint(code_question_id=cq_attempt.code_question_id, cq_attempt=cq_attempt, cq_submission=submission,
+                                  hash=fingerprint)
+            for fingerprint in fingerprints(normalize(submission.code, submission.language))
+        ])
+    return True
+
+
+def similar_pairs(code_question, limit=None) -> list:
+    """
+    Pairs of question attempts (of different candidates) of the code question sharing fingerprints, ranked by overlap:
+    shared fingerprints / fingerprints of the smaller submission. Pairs below PLAGIARISM_MIN_OVERLAP are not reported.
+    Fingerprints of the starter code of the question, and fingerprints found in more than PLAGIARISM_MAX_FREQUENCY of
+    the attempts or in more than PLAGIARISM_MAX_ATTEMPTS attempts (common code, see MIN_COMMON_ATTEMPTS), are ignored.
+    Each fingerprint adds at most PLAGIARISM_MAX_ATTEMPTS² / 2 pairs, so that the cost stays linear in the number of
+    fingerprints.
+    """
+    # starter code given to every candidate
+    ignored = set()
+    for snippet in CodeSnippet.objects.select_related("language").filter(code_question=code_question):
+        ignored |= fingerprints(normalize(snippet.code or "", snippet.language))
+
+    # inverted index of the question: attempts of each fingerprint
+    attempts_by_hash = defaultdict(list)
+    counts = Counter()
+    rows = SubmissionFingerprint.objects.filter(code_question=code_question).values_list("hash", "cq_attempt_id") \
+        .iterator(chunk_size=settings.REPORT_EXPORT_CHUNK_SIZE)
+    for fingerprint, cq_attempt_id in rows:
+        if fingerprint not in ignored:
+            attempts_by_hash[fingerprint].append(cq_attempt_id)
+            counts[cq_attempt_id] += 1
+
+    candidates = {cq_attempt["id"]: cq_attempt for cq_attempt in CodeQuestionAttempt.objects.filter(code_question=code_question)
+                  .values("id", "assessment_attempt_id", "assessment_attempt__candidate_id", "assessment_attempt__candidate__username")}
+    max_frequency = min(settings.PLAGIARISM_MAX_ATTEMPTS,
+                        max(MIN_COMMON_ATTEMPTS, int(len(counts) * settings.PLAGIARISM_MAX_FREQUENCY)))
+
+    shared = Counter()
+    for cq_attempt_ids in attempts_by_hash.values():
+        if len(cq_attempt_ids) > max_frequency:
+            continue
+        cq_attempt_ids.sort()
+        for i, first in enumerate(cq_attempt_ids):
+            for second in cq_attempt_ids[i + 1:]:
+                if candidates[first]["assessment_attempt__candidate_id"] != candidates[second]["assessment_attempt__candidate_id"]:
+                    shared[first, second] += 1
+
+    pairs = []
+    for (first, second), count in shared.items():
+        overlap = count / min(counts[first], counts[second])
+        if overlap >= settings.PLAGIARISM_MIN_OVERLAP:
+            pairs.append({
+                "attempts": [first, second],
+                "shared": count,
+                "overlap": round(overlap, 3),
+                "similarity": round(count / (counts[first] + counts[second] - count), 3),
+            })
+    pairs.sort(key=lambda pair: (pair["overlap"], pair["shared"]), reverse=True)
+    pairs = pairs[:limit] if limit else pairs
+
+    # indexed submission of each question attempt of the pairs
+    cq_attempt_ids = {cq_attempt_id for pair in pairs for cq_attempt_id in pair["attempts"]}
+    submissions = dict(SubmissionFingerprint.objects.filter(cq_attempt_id__in=cq_attempt_ids)
+                       .values_list("cq_attempt_id", "cq_submission_id").distinct())
+    for pair in pairs:
+        pair["attempts"] = [{
+            "username": candidates[cq_attempt_id]["assessment_attempt__candidate__username"],
+            "assessment_attempt_id": candidates[cq_attempt_id]["assessment_attempt_id"],
+            "cq_submission_id": submissions[cq_attempt_id],
+        } for cq_attempt_id in pair["attempts"]]
+    return pairs
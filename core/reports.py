@@ -0,0 +1,263 @@
+# exports of the assessment results
+import csv
+import json
+import zipfile
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import AssessmentAttempt, CodeQuestion, CodeQuestionSubmission, TestCase, TestCaseAttempt
+
+
+class Echo:
+    """
+    File-like object that returns what is written to it instead of storing it, used to stream csv.writer rows.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_chunks(header, rows):
+    """
+    Yields the lines of a CSV file, the header then each row (iterable of lists).
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def json_chunks(fields, key, items):
+    """
+    Yields the parts of a JSON object with the given fields and a list (under key): the fields, then each item.
+    """
+    yield json.dumps(fields, cls=DjangoJSONEncoder)[:-1] + f'{", " if fields else ""}"{key}": ['
+    for index, item in enumerate(items):
+        yield (", " if index else "") + json.dumps(item, cls=DjangoJSONEncoder)
+    yield ']}'
+
+
+def results_csv(assessment):
+    """
+    Header and rows of the results export: one row per submitted attempt, read in chunks.
+    """
+    attempts = AssessmentAttempt.objects.filter(assessment=assessment, time_submitted__isnull=False) \
+        .select_related("candidate").iterator(chunk_size=settings.REPORT_EXPORT_CHUNK_SIZE)
+
+    # columns: username, score, best_attempt, time_started, time_submitted, auto_submit
+    header = ["username", "score", "best_attempt", "time_started", "time_submitted", "auto_submit"]
+    rows = ([attempt.candidate.username,
+             attempt.score,
+             'Y' if attempt.best_attempt else 'N',
+             attempt.time_started,
+             attempt.time_submitted,
+             'Y' if attempt.auto_submit else 'N'] for attempt in attempts)
+    return header, rows
+
+
+def breakdown_questions(assessment, test_cases=False) -> list:
+    """
+    Returns the code questions of the assessment (id, name, max_score), in the order of the breakdown columns.
+    With test_cases, each question also has the list of its test cases (id, score).
+    """
+    questions = {question["id"]: {**question, "max_score": 0}
+                 for question in CodeQuestion.objects.filter(assessment=assessment).order_by("id").values("id", "name")}
+    for question in questions.values():
+        if test_cases:
+            question["test_cases"] = []
+
+    for test_case in TestCase.objects.filter(code_question__assessment=assessment).order_by("id") \
+            .values("id", "code_question_id", "score"):
+        question = questions[test_case["code_question_id"]]
+        question["max_score"] += test_case["score"]
+        if test_cases:
+            question["test_cases"].append({"id": test_case["id"], "score": test_case["score"]})
+
+    return list(questions.values())
+
+
+def breakdown_scores(assessment, test_cases=False):
+    """
+    Scores of the best submission of each code question attempt of the submitted attempts, from a single grouped query:
+    one row (attempt_id, question_id, score) per question attempt, or one row (attempt_id, question_id, test_case_id,
+    score) per test case with test_cases. Rows are ordered by attempt and read in chunks.
+    """
+    # best submission of the question attempt, the latest one if several have the best score
+    best_submission = CodeQuestionSubmission.objects.filter(cq_attempt=OuterRef("cq_submission__cq_attempt"),
+                                                            score__isnull=False) \
+        .order_by("-score", "-id").values("id")[:1]
+
+    group_by = ["attempt_id", "question_id"] + (["test_case_id"] if test_cases else [])
+    return TestCaseAttempt.objects \
+        .filter(cq_submission__cq_attempt__assessment_attempt__assessment=assessment,
+                cq_submission__cq_attempt__assessment_attempt__time_submitted__isnull=False,
+                cq_submission=Subquery(best_submission)) \
+        .annotate(attempt_id=F("cq_submission__cq_attempt__assessment_attempt_id"),
+                  question_id=F("test_case__code_question_id")) \
+        .values(*group_by) \
+        .annotate(score=Coalesce(Sum("test_case__score", filter=Q(status=3)), 0)) \
+        .order_by("attempt_id") \
+        .iterator(chunk_size=settings.REPORT_EXPORT_CHUNK_SIZE)
+
+
+def assessment_breakdown(assessment, test_cases=False):
+    """
+    Yields each submitted attempt of the assessment with the scores of its questions:
+    (attempt, {question_id: {"score": score, "test_cases": {test_case_id: score}}}).
+    Questions without a processed submission are missing from the dict (score 0).
+    The attempts and the scores are both read in chunks, ordered by attempt, and merged.
+    """
+    attempts = AssessmentAttempt.objects.filter(assessment=assessment, time_submitted__isnull=False) \
+        .select_related("candidate").order_by("id").iterator(chunk_size=settings.REPORT_EXPORT_CHUNK_SIZE)
+    scores = breakdown_scores(assessment, test_cases)
+
+    row = next(scores, None)
+    for attempt in attempts:
+        questions = {}
+        # rows of attempts submitted after the attempts were read are skipped
+        while row is not None and row["attempt_id"] <= attempt.id:
+            if row["attempt_id"] == attempt.id:
+                question = questions.setdefault(row["question_id"], {"score": 0, "test_cases": {}})
+                question["score"] += row["score"]
+                if test_cases:
+                    question["test_cases"][row["test_case_id"]] = row["score"]
+            row = next(scores, None)
+        yield attempt, questions
+
+
+def breakdown_csv(assessment, test_cases=False):
+    """
+    Header and rows of the breakdown export: one row per submitted attempt with the score of each code question (best
+    submission), and of each of its test cases with test_cases.
+    """
+    questions = breakdown_questions(assessment, test_cases)
+
+    # columns: username, score, best_attempt, time_submitted, then the score of each question (and its test cases)
+    header = ["username", "score", "best_attempt", "time_submitted"]
+    for index, question in enumerate(questions, start=1):
+        header.append(f"Q{index} {question['name']} ({question['max_score']})")
+        if test_cases:
+            header += [f"Q{index} TC{tc_index} ({test_case['score']})"
+                       for tc_index, test_case in enumerate(question["test_cases"], start=1)]
+
+    def rows():
+        for attempt, scores in assessment_breakdown(assessment, test_cases):
+            row = [attempt.candidate.username, attempt.score, 'Y' if attempt.best_attempt else 'N', attempt.time_submitted]
+            for question in questions:
+                question_scores = scores.get(question["id"], {"score": 0, "test_cases": {}})
+                row.append(question_scores["score"])
+                if test_cases:
+                    row += [question_scores["test_cases"].get(test_case["id"], 0) for test_case in question["test_cases"]]
+            yield row
+
+    return header, rows()
+
+
+def breakdown_json(assessment, test_cases=False):
+    """
+    Fields, key and items of the JSON breakdown export (see breakdown_csv): the questions, then one item per attempt.
+    """
+    questions = breakdown_questions(assessment, test_cases)
+
+    def items():
+        for attempt, scores in assessment_breakdown(assessment, test_cases):
+            attempt_questions = []
+            for question in questions:
+                question_scores = scores.get(question["id"], {"score": 0, "test_cases": {}})
+                item = {"id": question["id"], "score": question_scores["score"]}
+                if test_cases:
+                    item["test_cases"] = [{"id": test_case["id"], "score": question_scores["test_cases"].get(test_case["id"], 0)}
+                                          for test_case in question["test_cases"]]
+                attempt_questions.append(item)
+
+            yield {
+                "username": attempt.candidate.username,
+                "score": attempt.score,
+                "best_attempt": attempt.best_attempt,
+                "time_submitted": attempt.time_submitted,
+                "questions": attempt_questions,
+            }
+
+    return {"assessment": assessment.name, "questions": questions}, "attempts", items()
+
+
+class ZipStream:
+    """
+    Unseekable file-like object that keeps what zipfile writes to it until it is read with pop(), used to stream a ZIP
+    file while it is written.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def submissions_zip_chunks(assessment):
+    """
+    Yields the parts of a ZIP file of the code of all the submissions of the submitted attempts of the assessment:
+    <course>/<assessment>/<username>/<question>/submission_<n>.<language extension>, numbered in order of submission.
+    Submissions are read in chunks and each file is yielded once compressed, only the ZIP directory (a few hundred
+    bytes per file) is kept until the end.
+    """
+    course = assessment.course.short_name.replace(' ', '_').replace('/', '-')
+    test_name = assessment.name.replace(' ', '_').replace('/', '-')
+    questions = {question.id: f"Q{index}_{question.name}".replace(' ', '_').replace('/', '-')
+                 for index, question in enumerate(CodeQuestion.objects.filter(assessment=assessment).order_by("id"), start=1)}
+
+    submissions = CodeQuestionSubmission.objects \
+        .filter(cq_attempt__assessment_attempt__assessment=assessment, cq_attempt__assessment_attempt__time_submitted__isnull=False) \
+        .annotate(username=F("cq_attempt__assessment_attempt__candidate__username"),
+                  question_id=F("cq_attempt__code_question_id"),
+                  extension=F("language__file_extension")) \
+        .only("id", "code", "time_submitted") \
+        .order_by("username", "question_id", "id") \
+        .iterator(chunk_size=settings.REPORT_EXPORT_CHUNK_SIZE)
+
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        folder, number = None, 0
+        for submission in submissions:
+            # submissions are numbered for each candidate and question
+            submission_folder = f"{course}/{test_name}/{submission.username}/{questions[submission.question_id]}"
+            number = number + 1 if submission_folder == folder else 1
+            folder = submission_folder
+
+            info = zipfile.ZipInfo(f"{folder}/submission_{number}.{submission.extension}",
+                                   date_time=timezone.localtime(submission.time_submitted).timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, submission.code)
+            yield stream.pop()
+    yield stream.pop()
+
+
+def submissions_count(assessment) -> int:
+    return CodeQuestionSubmission.objects.filter(cq_attempt__assessment_attempt__assessment=assessment,
+                                                 cq_attempt__assessment_attempt__time_submitted__isnull=False).count()
+
+
+def attempts_count(assessment) -> int:
+    return AssessmentAttempt.objects.filter(assessment=assessment, time_submitted__isnull=False).count()
+
+
+# reports that can be built in the background (see ReportJob): file extension, content (chunks, about one per item)
+# and number of items (attempts or submissions) of each report
+REPORTS = {
+    "results": ("csv", lambda assessment: csv_chunks(*results_csv(assessment)), attempts_count),
+    "breakdown": ("csv", lambda assessment: csv_chunks(*breakdown_csv(assessment)), attempts_count),
+    "breakdown_test_cases": ("csv", lambda assessment: csv_chunks(*breakdown_csv(assessment, test_cases=True)), attempts_count),
+    "breakdown_json": ("json", lambda assessment: json_chunks(*breakdown_json(assessment, test_cases=True)), attempts_count),
+    "submissions": ("zip", lambda assessment: submissions_zip_chunks(assessment), submissions_count),
+}
@@ -0,0 +1,89 @@
+# processing of the uploaded candidate snapshots
+import os
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+# cv2 encoding parameters of the supported snapshot formats
+ENCODE_PARAMS = {
+    "jpg": cv2.IMWRITE_JPEG_QUALITY,
+    "webp": cv2.IMWRITE_WEBP_QUALITY,
+}
+
+
+def resize_to_fit(image, max_size):
+    """
+    Downscales an image so that its longest side is at most max_size pixels, smaller images are returned as-is.
+    """
+    height, width = image.shape[:2]
+    scale = max_size / max(height, width)
+    if scale >= 1:
+        return image
+    return cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def encode_image(image) -> bytes:
+    """
+    Encodes an image in the SNAPSHOT_FORMAT, with the SNAPSHOT_QUALITY.
+    """
+    success, buffer = cv2.imencode(f".{settings.SNAPSHOT_FORMAT}", image,
+                                   [ENCODE_PARAMS[settings.SNAPSHOT_FORMAT], settings.SNAPSHOT_QUALITY])
+    if not success:
+        raise ValueError("Unable to encode the snapshot.")
+    return buffer.tobytes()
+
+
+def image_hash(image) -> str:
+    """
+    Perceptual hash (dHash) of an image, as 16 hex digits: each of the 64 bits compares two neighbouring pixels of the
+    image shrunk to 9x8 grayscale. Near-identical images have hashes that differ in few bits.
+    """
+    gray = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+
+def hash_distance(hash_1, hash_2) -> int:
+    """
+    Number of different bits of two image hashes.
+    """
+    return bin(int(hash_1, 16) ^ int(hash_2, 16)).count("1")
+
+
+def read_image(field):
+    """
+    Decodes an image file (ImageField of a model instance) through its storage, so that it can be read by any worker,
+    regardless of where the files are stored. Returns None if the file is not a valid image.
+    """
+    with field.open('rb') as file:
+        data = file.read()
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def ingest_snapshot(snapshot, uploaded_file):
+    """
+    Sets the image files of a new CandidateSnapshot from the uploaded image (does not save the snapshot).
+    The upload is decoded once, then stored downscaled to the face detection resolution and re-encoded, along with a
+    thumbnail for the review gallery. The original upload is only kept if SNAPSHOT_KEEP_ORIGINAL is set.
+    The hash of the image is used to skip the face detection of near-duplicate snapshots.
+    Uploads that cannot be decoded are stored as-is.
+    """
+    data = uploaded_file.read()
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        snapshot.image.save(uploaded_file.name, ContentFile(data), save=False)
+        return
+
+    snapshot.image_hash = image_hash(image)
+
+    # keep the name of the upload (e.g. "initial" snapshots), with the extension of the new format
+    name = os.path.splitext(os.path.basename(uploaded_file.name))[0]
+    extension = settings.SNAPSHOT_FORMAT
+
+    snapshot.image.save(f"{name}.{extension}", ContentFile(encode_image(resize_to_fit(image, settings.SNAPSHOT_MAX_SIZE))), save=False)
+    snapshot.thumbnail.save(f"{name}_thumbnail.{extension}",
+                            ContentFile(encode_image(resize_to_fit(image, settings.SNAPSHOT_THUMBNAIL_SIZE))), save=False)
+    if settings.SNAPSHOT_KEEP_ORIGINAL:
+        snapshot.original.save(uploaded_file.name, ContentFile(data), save=False)
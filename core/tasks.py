@@ -1,139 +1,457 @@
 # celery tasks
-import requests
-import cv2
-import os
-from celery import shared_task
-from insightface.app import FaceAnalysis
+from collections import defaultdict
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from celery import group, shared_task
+from celery.exceptions import MaxRetriesExceededError
+from celery.utils.log import get_task_logger
 from django.conf import settings
 from django.core import mail
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Exists, F, Max, OuterRef, Q
 from django.utils import timezone
 
-from core.models import TestCaseAttempt, CodeQuestionSubmission, AssessmentAttempt, CandidateSnapshot
+from core.face_detection import count_faces
+from core.judge0 import callbacks_enabled, get_client, cache_test_case_attempt_results, Judge0Error
+from core.models import TestCaseAttempt, CodeQuestionSubmission, CodeQuestionAttempt, AssessmentAttempt, CandidateSnapshot, \
+    ReportJob, Assessment, AssessmentStatistics
+from core.plagiarism import index_question_attempt
+from core.reports import REPORTS
+from core.snapshots import hash_distance, read_image
+
+logger = get_task_logger(__name__)
+
+
+def save_test_case_attempt_result(tca, data):
+    """
+    Saves the result of a judge0 submission (status_id, stdout, time, memory) to a TestCaseAttempt.
+    If the TestCaseAttempt is no longer pending, initiates the update of its CodeQuestionSubmission.
+    """
+    tca.status = data.get('status_id')
+    tca.stdout = data.get('stdout')
+    tca.time = data.get('time')
+    tca.memory = data.get('memory')
+    tca.save()
+
+    if tca.status not in [1, 2]:
+        cache_test_case_attempt_results([tca])
+        update_cqs_passed_flag.delay(tca.cq_submission_id)
+
 
 @shared_task
-def update_test_case_attempt_status(tca_id: int, token: str, last_status: int = 1):
+def poll_pending_test_case_attempts(tca_ids=None):
     """
-    Polls judge0 to get the status_id of a single submission (one test case)
-    If status_id has been changed, save the change to db.
-    If the submission is still being processed, re-queue this task to be polled again later.
+    Periodic task, polls judge0 for the results of all pending (In Queue/Processing) TestCaseAttempts, or only of the
+    given TestCaseAttempts.
+    Submissions are retrieved in batches (GET /submissions/batch), outside of any transaction. Each change is saved with
+    a conditional update (the TestCaseAttempt still has the status that was polled), so that the results already saved
+    by an overlapping run (slow judge0) or by a callback are neither saved nor processed again.
+    If callbacks are enabled, only TestCaseAttempts that are still pending after the callback grace period are polled
+    (fallback for lost callbacks, e.g. web server restarted, callback arrived before the TestCaseAttempt was created).
     """
-    try:
+    pending = TestCaseAttempt.objects.filter(status__in=[1, 2])
+    if tca_ids is not None:
+        pending = pending.filter(id__in=tca_ids)
+    if callbacks_enabled():
+        cutoff = timezone.now() - timedelta(seconds=settings.JUDGE0_CALLBACK_GRACE_PERIOD)
+        pending = pending.filter(cq_submission__time_submitted__lt=cutoff)
+    pending = pending.only('id', 'token', 'status', 'cq_submission_id', 'digest').order_by('id')
+
+    updated = []
+    client = get_client()
+    last_id = 0
+    while True:
+        batch = list(pending.filter(id__gt=last_id)[:client.batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].id
+
         # call judge0
-        url = f"{settings.JUDGE0_URL}/submissions/{token}?base64_encoded=false&fields=status_id,stdout,time,memory"
-        res = requests.get(url)
-        data = res.json()
-
-        status_id = data.get('status_id')
-        stdout = data.get('stdout')
-        time = data.get('time')
-        memory = data.get('memory')
-
-        if status_id is not None:
-            # if status_id is different from the previous run of this task, update db
-            if status_id != last_status:
-                last_status = status_id
-                tca = TestCaseAttempt.objects.prefetch_related('cq_submission').get(id=tca_id)
-                tca.status = status_id
-                tca.stdout = stdout
-                tca.time = time
-                tca.memory = memory
-                tca.save()
-                update_cqs_passed_flag.delay(tca.cq_submission.id)
-
-            # if submission is still queued or processing, re-queue this task
-            if status_id in [1, 2]:
-                update_test_case_attempt_status.apply_async((tca_id, token, last_status), countdown=0.5)
-    except ConnectionError:
-        pass
+        try:
+            submissions = client.get_submissions([tca.token for tca in batch], "token,status_id,stdout,time,memory")
+        except Judge0Error:
+            break
+
+        # unknown tokens are returned as null
+        results = {submission['token']: submission for submission in submissions if submission}
+
+        # only save the TestCaseAttempts whose status has changed, and that have not been updated in the meantime
+        for tca in batch:
+            result = results.get(tca.token)
+            if result and result.get('status_id') is not None and result.get('status_id') != tca.status:
+                if TestCaseAttempt.objects.filter(id=tca.id, status=tca.status) \
+                        .update(status=result.get('status_id'), stdout=result.get('stdout'), time=result.get('time'),
+                                memory=result.get('memory')):
+                    tca.status = result.get('status_id')
+                    tca.stdout = result.get('stdout')
+                    tca.time = result.get('time')
+                    tca.memory = result.get('memory')
+                    updated.append(tca)
+
+    cache_test_case_attempt_results(updated)
+
+    # initiate the update of the CodeQuestionSubmissions that might have been completed
+    for cqs_id in {tca.cq_submission_id for tca in updated if tca.status not in [1, 2]}:
+        update_cqs_passed_flag.delay(cqs_id)
+
+
+@shared_task
+def update_test_case_attempt_status(tca_id, token, last_status=1):
+    """
+    Replaced by poll_pending_test_case_attempts, kept for the tasks queued before the upgrade (no longer queued).
+    Polls the TestCaseAttempt once, if it is still pending afterwards it is polled again by the periodic task.
+    To be removed in the next release.
+    """
+    poll_pending_test_case_attempts([tca_id])
 
 
 @shared_task
 def update_cqs_passed_flag(cqs_id):
     """
     Checks if all test cases of a CodeQuestionSubmission has been processed by judge0.
-    Update the "passed" field of the CQS instance and initiates the computation of the submission score.
+    Update the "passed" and "score" fields of the CQS instance, and the best score of its CodeQuestionAttempt.
     If it was already calculated previously, nothing will be done.
+    If this was the last processing submission of a submitted AssessmentAttempt, initiates the computation of its score.
     """
     # check if all test cases have been completed
     finished = not TestCaseAttempt.objects.filter(cq_submission_id=cqs_id, status__in=[1, 2]).exists()
 
     # only continue if test cases are complete
     if finished:
-        # get cqs object
-        cqs = CodeQuestionSubmission.objects.get(id=cqs_id)
+        with transaction.atomic():
+            # lock the question attempt, then get the cqs object. the best score and the passed flag are saved together,
+            # so that the score of the assessment attempt is never computed with a processed submission missing from
+            # the best score (see AssessmentAttempt.has_processing_submission)
+            cq_attempt_id = CodeQuestionSubmission.objects.filter(id=cqs_id).values_list('cq_attempt_id', flat=True).get()
+            CodeQuestionAttempt.objects.select_for_update().filter(id=cq_attempt_id).only('id').get()
+            cqs = CodeQuestionSubmission.objects.get(id=cqs_id)
+
+            # only continue if it was not previously calculated
+            if cqs.passed is not None:
+                return
 
-        # only continue if it was not previously calculated
-        if cqs.passed is None:
-            # update the passed flag
+            # update the best score of the question attempt, then the passed flag and score
             passed = not TestCaseAttempt.objects.filter(cq_submission_id=cqs_id, status__range=(4, 14)).exists()
             cqs.passed = passed
+            cqs.score = cqs.compute_score()
+            CodeQuestionAttempt.objects.filter(id=cq_attempt_id, best_score__lt=cqs.score).update(best_score=cqs.score)
             cqs.save()
 
+        # the latest submission with the best score is indexed for the plagiarism screening
+        if settings.PLAGIARISM_INDEX and CodeQuestionAttempt.objects.filter(id=cqs.cq_attempt_id, best_score=cqs.score).exists():
+            index_plagiarism_fingerprints.delay(cqs.cq_attempt_id)
+
+        # compute the score if the assessment attempt has been submitted and was waiting for this submission
+        assessment_attempt = AssessmentAttempt.objects.get(codequestionattempt__id=cqs.cq_attempt_id)
+        if assessment_attempt.time_submitted and assessment_attempt.score is None \
+                and not assessment_attempt.has_processing_submission():
+            compute_assessment_attempt_score.delay(assessment_attempt.id)
+
 
 @shared_task
-def force_submit_assessment(assessment_attempt_id):
+def index_plagiarism_fingerprints(cq_attempt_id):
     """
-    Server-side submission of an assessment.
-    This ensures that an AssessmentAttempt will be marked as submitted when the duration runs out, even if the user is not on the
-    assessment page.
-    If the AssessmentAttempt was already submitted previously (i.e. by the user), nothing will be done.
+    Indexes the fingerprints of the best submission of a CodeQuestionAttempt for the plagiarism screening
+    (see core.plagiarism), replacing the ones of its previous best submission.
     """
-    try:
-        assessment_attempt = AssessmentAttempt.objects.get(id=assessment_attempt_id, time_submitted=None)
-        if assessment_attempt:
-            assessment_attempt.auto_submit = True  # set the auto_submit flag
-            assessment_attempt.time_submitted = timezone.now()
-            assessment_attempt.save()
-            # queue task to compute score for this AssessmentAttempt
-            compute_assessment_attempt_score.apply_async((assessment_attempt.id,), countdown=1)
-    except:
-        pass
+    cq_attempt = CodeQuestionAttempt.objects.filter(id=cq_attempt_id).first()
+    if cq_attempt is not None:
+        index_question_attempt(cq_attempt)
 
 
 @shared_task
-def compute_assessment_attempt_score(assessment_attempt_id):
+def force_submit_overdue_assessment_attempts(assessment_attempt_ids=None):
+    """
+    Periodic task, server-side submission of the AssessmentAttempts whose deadline has passed (all of them, or only the
+    given AssessmentAttempts).
+    This ensures that an AssessmentAttempt will be marked as submitted when the duration runs out or the assessment has ended,
+    even if the user is not on the assessment page.
+    The attempts are submitted with a single update, then the computation of their scores is queued.
+    """
+    now = timezone.now()
+
+    unsubmitted = AssessmentAttempt.objects.filter(time_submitted=None)
+    if assessment_attempt_ids is not None:
+        unsubmitted = unsubmitted.filter(id__in=assessment_attempt_ids)
+
+    # the end time of the assessment is checked as well, in case it was changed after the attempt was started.
+    # two separate queries (instead of an OR across the join), so that the first one uses the partial deadline index
+    overdue_ids = set(unsubmitted.filter(deadline__lt=now).values_list('id', flat=True))
+    overdue_ids |= set(unsubmitted.filter(assessment__time_end__lt=now - AssessmentAttempt.DEADLINE_GRACE_PERIOD)
+                       .values_list('id', flat=True))
+    if not overdue_ids:
+        return
+
+    with transaction.atomic():
+        # lock the overdue attempts, attempts being submitted by the user at the same time are skipped (and no longer
+        # overdue on the next run), so that the score of each attempt is only queued by whoever submitted it
+        overdue_ids = list(AssessmentAttempt.objects.select_for_update(skip_locked=True)
+                           .filter(id__in=overdue_ids, time_submitted=None).values_list('id', flat=True))
+        if not overdue_ids:
+            return
+        AssessmentAttempt.objects.filter(id__in=overdue_ids).update(auto_submit=True, time_submitted=now)
+
+    # queue tasks to compute the scores of the submitted attempts
+    group(compute_assessment_attempt_score.s(assessment_attempt_id) for assessment_attempt_id in overdue_ids).apply_async()
+
+
+@shared_task
+def force_submit_assessment(assessment_attempt_id):
+    """
+    Replaced by force_submit_overdue_assessment_attempts, kept for the tasks queued before the upgrade (no longer queued).
+    Submits the AssessmentAttempt if it is overdue, otherwise it is submitted by the periodic task once its deadline has
+    passed. To be removed in the next release.
+    """
+    force_submit_overdue_assessment_attempts([assessment_attempt_id])
+
+
+@shared_task(bind=True, max_retries=settings.SCORE_MAX_RETRIES)
+def compute_assessment_attempt_score(self, assessment_attempt_id):
     """
     This task is queued when an AssessmentAttempt has been submitted (both user-initiated and server-side)
     This tasks calculates the total score of the AssessmentAttempt, and determines if it is the best attempt.
-    If the AssessmentAttempt contains a submission that is still being processed, the task will be delayed.
+    If the AssessmentAttempt contains a submission that is still being processed, the score is computed once the last
+    submission has been processed (see update_cqs_passed_flag). The task is only retried after SCORE_RETRY_DELAY seconds
+    as a safety net.
     """
     try:
         # get the instance
         assessment_attempt = AssessmentAttempt.objects.get(id=assessment_attempt_id)
-        
-        # if all test cases are complete, proceed to compute score
-        if not assessment_attempt.has_processing_submission():
-            assessment_attempt.compute_score()
-        # if still processing, queue it again with a 5s delay
+    except AssessmentAttempt.DoesNotExist:
+        return
+
+    # already computed (e.g. by update_cqs_passed_flag before this retry)
+    if assessment_attempt.score is not None:
+        return
+
+    # if all test cases are complete, proceed to compute score
+    if not assessment_attempt.has_processing_submission():
+        assessment_attempt.compute_score()
+    # if still processing, retry later in case the completion of the last submission is missed
+    else:
+        try:
+            raise self.retry(countdown=settings.SCORE_RETRY_DELAY)
+        except MaxRetriesExceededError:
+            # the score is computed by score_unscored_assessment_attempts once the submissions are processed
+            logger.warning(f"AssessmentAttempt {assessment_attempt_id} still has processing submissions after "
+                           f"{settings.SCORE_MAX_RETRIES} retries.")
+
+
+@shared_task
+def score_unscored_assessment_attempts():
+    """
+    Periodic task, safety net of the scores: queues the computation of the score of the AssessmentAttempts submitted more
+    than SCORE_RETRY_DELAY seconds ago that are still not scored, although none of their submissions are processing
+    (e.g. the completion of the last submission was missed, or compute_assessment_attempt_score gave up).
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.SCORE_RETRY_DELAY)
+    processing = CodeQuestionSubmission.objects.filter(cq_attempt__assessment_attempt=OuterRef('pk'), passed=None)
+    unscored_ids = list(AssessmentAttempt.objects.filter(time_submitted__isnull=False, score__isnull=True, time_submitted__lt=cutoff)
+                        .exclude(Exists(processing)).values_list('id', flat=True))
+    if not unscored_ids:
+        return
+
+    logger.warning(f"Computing the missed scores of {len(unscored_ids)} AssessmentAttempts.")
+    group(compute_assessment_attempt_score.s(assessment_attempt_id) for assessment_attempt_id in unscored_ids).apply_async()
+
+
+@shared_task
+def rebuild_assessment_statistics(assessment_id):
+    """
+    Rebuilds the statistics of an assessment report, queued when an attempt is rescored (see AssessmentStatistics.record_score).
+    """
+    assessment = Assessment.objects.filter(id=assessment_id).first()
+    if assessment is not None:
+        AssessmentStatistics.rebuild(assessment)
+
+
+def detect_snapshot_faces(snapshot):
+    """
+    Detects the faces of a CandidateSnapshot: sets faces_detected, or detection_failed if the file is not a valid image.
+    Returns False if the detection failed for another reason (e.g. storage or detector error), the snapshot is then left
+    pending and detected again once its claim has expired (see FACE_DETECTION_CLAIM_TIMEOUT).
+    """
+    try:
+        image = read_image(snapshot.image)
+        if image is None:
+            snapshot.detection_failed = True
         else:
-            compute_assessment_attempt_score.apply_async((assessment_attempt_id,), countdown=5)
-    except:
-        pass
+            snapshot.faces_detected = count_faces(image)
+        return True
+    except Exception:
+        logger.exception(f"Face detection of CandidateSnapshot {snapshot.id} failed.")
+        return False
+
+
+def find_duplicate_snapshots(batch):
+    """
+    Finds the snapshots of a batch that are near-duplicates (hash distance within SNAPSHOT_DUPLICATE_THRESHOLD) of the
+    last detected snapshot of the same attempt, i.e. the candidate has not moved.
+    Returns the detected snapshot of each duplicate, keyed by the id of the duplicate. The detected snapshot is either
+    a previously detected snapshot, or a snapshot of this batch that is not a duplicate.
+    """
+    if settings.SNAPSHOT_DUPLICATE_THRESHOLD < 0:
+        return {}
+
+    # last detected snapshot of each attempt
+    last_ids = CandidateSnapshot.objects \
+        .filter(assessment_attempt_id__in={snapshot.assessment_attempt_id for snapshot in batch},
+                faces_detected__isnull=False, detection_skipped=False, image_hash__isnull=False) \
+        .values('assessment_attempt_id').annotate(last_id=Max('id')).values_list('last_id', flat=True)
+    last_detected = {snapshot.assessment_attempt_id: snapshot for snapshot in
+                     CandidateSnapshot.objects.filter(id__in=list(last_ids)).only('id', 'assessment_attempt_id', 'image_hash', 'faces_detected')}
+
+    duplicates = {}
+    for snapshot in batch:
+        if not snapshot.image_hash:
+            continue
+        reference = last_detected.get(snapshot.assessment_attempt_id)
+        if reference and hash_distance(snapshot.image_hash, reference.image_hash) <= settings.SNAPSHOT_DUPLICATE_THRESHOLD:
+            duplicates[snapshot.id] = reference
+        else:
+            last_detected[snapshot.assessment_attempt_id] = snapshot
+    return duplicates
+
+
+def update_proctoring_counts(snapshots):
+    """
+    Adds the snapshots with multiple faces (except initial snapshots) and without faces to the counts of their
+    AssessmentAttempts, once the faces of the snapshots have been detected.
+    """
+    counts = defaultdict(lambda: [0, 0])
+    for snapshot in snapshots:
+        if snapshot.faces_detected is None:
+            continue
+        if snapshot.faces_detected > 1 and "initial" not in snapshot.image.name:
+            counts[snapshot.assessment_attempt_id][0] += 1
+        elif snapshot.faces_detected == 0:
+            counts[snapshot.assessment_attempt_id][1] += 1
+
+    for assessment_attempt_id, (multiple_faces, no_faces) in counts.items():
+        AssessmentAttempt.objects.filter(id=assessment_attempt_id).update(multiple_faces_count=F('multiple_faces_count') + multiple_faces,
+                                                                          no_faces_count=F('no_faces_count') + no_faces)
+
+
+@shared_task
+def detect_faces_pending_snapshots(snapshot_ids=None):
+    """
+    Periodic task, detects the number of faces in the pending CandidateSnapshots (faces_detected not computed yet), or
+    only in the given CandidateSnapshots.
+    Snapshots are processed in micro-batches of FACE_DETECTION_BATCH_SIZE: the batch is claimed in a short transaction
+    (concurrent runs skip it), the images are decoded and detected in a thread pool sharing the detector of this process
+    (see core.face_detection) outside of any transaction, then the results are saved with a single bulk update and added
+    to the proctoring counts of the AssessmentAttempts in a second short transaction.
+    Near-duplicates of the previous snapshot of the attempt are not detected again, the previous result is copied.
+    Snapshots whose detection failed stay pending and claimed, they are detected again by a later run.
+    """
+    pending = CandidateSnapshot.objects.filter(faces_detected=None, detection_failed=False)
+    if snapshot_ids is not None:
+        pending = pending.filter(id__in=snapshot_ids)
+
+    processed = skipped = 0
+    with ThreadPoolExecutor(max_workers=settings.FACE_DETECTION_WORKERS) as executor:
+        while True:
+            # claim the batch, the snapshots claimed by a run that did not complete them are claimed again after a while
+            claimed_at = timezone.now()
+            with transaction.atomic():
+                batch = list(pending.select_for_update(skip_locked=True)
+                             .filter(Q(detection_claimed_at=None) |
+                                     Q(detection_claimed_at__lt=claimed_at - timedelta(seconds=settings.FACE_DETECTION_CLAIM_TIMEOUT)))
+                             .only('id', 'assessment_attempt_id', 'image', 'image_hash')
+                             .order_by('id')[:settings.FACE_DETECTION_BATCH_SIZE])
+                CandidateSnapshot.objects.filter(id__in=[snapshot.id for snapshot in batch]).update(detection_claimed_at=claimed_at)
+            if not batch:
+                break
+
+            duplicates = find_duplicate_snapshots(batch)
+            detected = [snapshot for snapshot in batch if snapshot.id not in duplicates]
+            list(executor.map(detect_snapshot_faces, detected))
+
+            # the detected snapshot may be part of this batch, copy the results once all have been detected
+            for snapshot in batch:
+                if snapshot.id in duplicates and duplicates[snapshot.id].faces_detected is not None:
+                    snapshot.faces_detected = duplicates[snapshot.id].faces_detected
+                    snapshot.detection_skipped = True
+
+            with transaction.atomic():
+                # only the snapshots that are still claimed by this run are saved (and counted once)
+                claimed = set(CandidateSnapshot.objects.select_for_update()
+                              .filter(id__in=[snapshot.id for snapshot in batch], faces_detected=None, detection_claimed_at=claimed_at)
+                              .values_list('id', flat=True))
+                done = [snapshot for snapshot in batch if snapshot.id in claimed
+                        and (snapshot.faces_detected is not None or snapshot.detection_failed)]
+                CandidateSnapshot.objects.bulk_update(done, ['faces_detected', 'detection_skipped', 'detection_failed'])
+                update_proctoring_counts(done)
+
+            processed += len(done)
+            skipped += sum(1 for snapshot in done if snapshot.detection_skipped)
+
+    if processed:
+        logger.info(f"Face detection: {processed} snapshots, {skipped} near-duplicates skipped ({skipped / processed:.0%}).")
 
 
 @shared_task
 def detect_faces(snapshot_id):
     """
-    This task is queued when candidate snapshot is uploaded.
-    This task uses InsightFace to detect number of faces in the snapshot.
-    Celery worker will take some time to download model_pack_name on the first run, progress be viewed
-    in the celery container logs.
+    Replaced by detect_faces_pending_snapshots, kept for the tasks queued before the upgrade (no longer queued).
+    Detects the faces of the CandidateSnapshot unless it is already claimed by the periodic task.
+    To be removed in the next release.
     """
+    detect_faces_pending_snapshots([snapshot_id])
+
+
+@shared_task
+def build_report(report_job_id):
+    """
+    Builds the file of a ReportJob in the background, the progress is saved every REPORT_EXPORT_CHUNK_SIZE items.
+    The file is written to a temporary file then saved to the storage, the previous versions of the report that finished
+    more than REPORT_JOB_RETENTION seconds ago are deleted (with their files).
+    """
+    # the job may be queued more than once
+    if not ReportJob.objects.filter(id=report_job_id, status=ReportJob.Statuses.PENDING) \
+            .update(status=ReportJob.Statuses.RUNNING, time_updated=timezone.now()):
+        return
+    job = ReportJob.objects.select_related('assessment__course').get(id=report_job_id)
+    extension, content, count = REPORTS[job.report]
+
     try:
-        snapshot = CandidateSnapshot.objects.get(id=snapshot_id)
-        image_path = os.path.join(settings.MEDIA_ROOT, snapshot.image.name)
+        job.total = count(job.assessment)
+        job.save(update_fields=['total', 'time_updated'])
 
-        model_pack_name = "buffalo_sc"
-        app = FaceAnalysis(name=model_pack_name)
-        app.prepare(ctx_id=0, det_size=(640, 640))
-        image = cv2.imread(image_path)
-        faces = app.get(image)
+        with tempfile.TemporaryFile() as file:
+            # about one chunk per item (after the header of the text reports)
+            for index, chunk in enumerate(content(job.assessment)):
+                file.write(chunk.encode() if isinstance(chunk, str) else chunk)
+                if index and index % settings.REPORT_EXPORT_CHUNK_SIZE == 0:
+                    ReportJob.objects.filter(id=job.id).update(processed=min(index, job.total), time_updated=timezone.now())
 
-        snapshot.faces_detected = len(faces)
-        snapshot.save()
+            file.seek(0)
+            filename = f"{job.assessment.course.code}_{job.assessment.name}_{job.report}_v{job.data_version}".replace(' ', '_')
+            job.file.save(f"{filename}.{extension}", File(file), save=False)
+    except Exception as ex:
+        logger.exception(f"Report {job.id} failed.")
+        job.status = ReportJob.Statuses.FAILED
+        job.error = f"{ex}"
+        job.time_finished = timezone.now()
+        job.save(update_fields=['status', 'error', 'time_finished', 'time_updated'])
+        return
 
-    except:
-        pass
+    job.status = ReportJob.Statuses.DONE
+    job.processed = job.total
+    job.time_finished = timezone.now()
+    job.save(update_fields=['file', 'status', 'processed', 'time_finished', 'time_updated'])
+
+    # previous versions of the report are no longer requested. the pending and running ones are left to finish, and the
+    # finished ones are kept for a while, as they may still be polled or downloaded
+    for previous_job in ReportJob.objects.filter(assessment=job.assessment, report=job.report, data_version__lt=job.data_version,
+                                                 status__in=[ReportJob.Statuses.DONE, ReportJob.Statuses.FAILED],
+                                                 time_finished__lt=timezone.now() - timedelta(seconds=settings.REPORT_JOB_RETENTION)):
+        if previous_job.file:
+            previous_job.file.delete(save=False)
+        previous_job.delete()
 
 
 @shared_task
@@ -74,14 +74,25 @@ urlpatterns = [
     path('api/get-tc-details/', attempts.get_tc_details, name='get-tc-details'),  # ajax
     path('api/code-question-submission/<int:code_question_attempt_id>/', attempts.code_question_submission, name='code-question-submission'),  # ajax
     path('api/get-cq-submission-status/', attempts.get_cq_submission_status, name='get-cq-submission-status'),  # ajax
+    path('api/judge0-callback/', attempts.judge0_callback, name='judge0-callback'),  # judge0
 
     # reports
     path('assessment/report/<int:assessment_id>/', reports.assessment_report, name='assessment-report'),
     path('api/get-candidate-attempts/<int:assessment_id>/', reports.get_candidate_attempts, name='get-candidate-attempts'),  # ajax
+    path('api/report/best-attempts/<int:assessment_id>/', reports.get_best_attempts, name='get-best-attempts'),  # ajax
+    path('api/report/ongoing-attempts/<int:assessment_id>/', reports.get_ongoing_attempts, name='get-ongoing-attempts'),  # ajax
     path('assessment/attempt/details/', reports.assessment_attempt_details, name='assessment-attempt-details'),
     path('assessment/submission/details/<int:cqs_id>/', reports.submission_details, name='submission-details'),
     path('assessment/export-assessment-results/<int:assessment_id>/', reports.export_assessment_results, name='export-assessment-results'),
+    path('assessment/export-assessment-breakdown/<int:assessment_id>/', reports.export_assessment_breakdown, name='export-assessment-breakdown'),
+    path('assessment/export-assessment-submissions/<int:assessment_id>/', reports.export_assessment_submissions, name='export-assessment-submissions'),
+    path('api/similar-submissions/<int:code_question_id>/', reports.get_similar_submissions, name='get-similar-submissions'),  # ajax
+    path('api/report-jobs/<int:assessment_id>/', reports.create_report_job, name='create-report-job'),  # ajax
+    path('api/report-jobs/status/<int:report_job_id>/', reports.get_report_job, name='get-report-job'),  # ajax
+    path('report-jobs/download/<int:report_job_id>/', reports.download_report, name='download-report'),
     path('assessment/submission/candidate-snapshots/', reports.candidate_snapshots, name='candidate-snapshots'),
+    path('api/candidate-snapshots/<int:assessment_attempt_id>/', reports.get_candidate_snapshots, name='get-candidate-snapshots'),  # ajax
+    path('assessment/submission/candidate-snapshots/thumbnail/<int:snapshot_id>/', reports.snapshot_thumbnail, name='snapshot-thumbnail'),
 
     # exporting stdin, stdout
     path('export/testcase/stdin/', reports.export_test_case_stdin, name="export-test-case-stdin"),  # stdin
@@ -1,9 +1,6 @@
-from datetime import timedelta, datetime
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
 
-import cv2
-import requests
-import os
-import numpy as np
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
 from django.contrib import messages
@@ -12,17 +9,21 @@ from django.db import transaction
 from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
-from insightface.app import FaceAnalysis
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, renderer_classes
+from rest_framework.decorators import api_view, renderer_classes, authentication_classes, permission_classes
 from rest_framework.renderers import JSONRenderer
 
 from core.decorators import groups_allowed, UserGroup
+from core.face_detection import count_faces, count_faces_in_upload, DetectionPoolBusy
+from core.judge0 import callbacks_enabled, callback_url, verify_callback_key, parse_callback, get_client, Judge0Error, \
+    Judge0ConnectionError, submission_digest, get_cached_results, get_cached_token, cache_pending_submission, \
+    cache_submission_result
 from core.models import Assessment, AssessmentAttempt, CodeQuestionAttempt, CodeQuestion, TestCase, CodeSnippet, \
     CodeQuestionSubmission, TestCaseAttempt, Language, CandidateSnapshot
-from core.tasks import update_test_case_attempt_status, force_submit_assessment, compute_assessment_attempt_score, \
-    detect_faces
+from core.snapshots import ingest_snapshot, read_image
+from core.tasks import compute_assessment_attempt_score, save_test_case_attempt_result, update_cqs_passed_flag, \
+    update_proctoring_counts
 from core.views.utils import get_assessment_attempt_question, check_permissions_course, user_enrolled_in_course, construct_judge0_params
 
 
@@ -150,18 +151,18 @@ def enter_assessment(request, assessment_id):
                 image = request.FILES['image']
 
                 snapshot = CandidateSnapshot(assessment_attempt=assessment_attempt, 
-                                            attempt_number=attempt_number, timestamp=timestamp_tz, image=image)
+                                            attempt_number=attempt_number, timestamp=timestamp_tz)
+                ingest_snapshot(snapshot, image)
                 snapshot.save()
 
                 """ 
-                if celery worker container is running on a machine that's different from dev machine, use local_detect_faces instead of detect_faces.delay.
-                cannot queue as task because MEDIA_ROOT are different directories
+                faces are detected by the periodic detect_faces_pending_snapshots task, which reads the snapshot through the storage.
+                if the files are stored in MEDIA_ROOT and the celery worker runs on a machine that does not share this directory,
+                configure an S3 compatible storage (see settings.py) or use local_detect_faces instead.
                 """
                 # if settings.DEBUG:
                 #     local_detect_faces(snapshot)
 
-                detect_faces.delay(snapshot.id)
-
             return redirect('attempt-question', assessment_attempt_id=assessment_attempt.id, question_index=0)
 
     raise Http404()
@@ -177,19 +178,17 @@ def generate_assessment_attempt(user, assessment):
         # create assessment attempt object
         assessment_attempt = AssessmentAttempt.objects.create(candidate=user, assessment=assessment)
 
+        # the attempt is automatically submitted once the deadline has passed (see force_submit_overdue_assessment_attempts),
+        # even if the user has closed the page
+        assessment_attempt.deadline = assessment_attempt.compute_deadline()
+        assessment_attempt.save(update_fields=['deadline'])
+
         # generate a cq_attempt for each code question in the assessment
         code_questions = CodeQuestion.objects.filter(assessment=assessment).order_by('id')
         cq_attempts = [CodeQuestionAttempt(assessment_attempt=assessment_attempt, code_question=cq) for cq in
                        code_questions]
         CodeQuestionAttempt.objects.bulk_create(cq_attempts)
 
-    # queue celery task to automatically submit the attempt when duration has lapsed (30 seconds grace period)
-    # ensures that the attempt is automatically submitted even if the user has closed the page
-    duration = assessment_attempt.assessment.duration
-    if duration != 0:  # if duration is 0 (unlimited time), no need to auto submit
-        auto_submission_time = timezone.now() + timedelta(minutes=duration) + timedelta(seconds=30)
-        force_submit_assessment.apply_async((assessment_attempt.id,), eta=auto_submission_time)
-
     return assessment_attempt
 
 
@@ -266,6 +265,7 @@ def submit_single_test_case(request, test_case_id):
     Submits a single test case to judge0 for execution, returns the token.
     This is used for the "Compile and Run" option for users to run the sample test case.
     This submission is not stored in the database.
+    If an identical submission has already been executed (or is still being executed), its token is returned instead.
     """
     try:
         if request.method == "POST":
@@ -288,27 +288,34 @@ def submit_single_test_case(request, test_case_id):
             
             params = construct_judge0_params(code, lang_id, test_case)
 
+            # reuse an identical submission
+            digest = submission_digest(params)
+            token = get_cached_token(digest)
+            if token:
+                context = {
+                    "result": "success",
+                    "token": token,
+                }
+                return Response(context, status=status.HTTP_200_OK)
+
             # call judge0
             try:
-                url = settings.JUDGE0_URL + "/submissions/?base64_encoded=false&wait=false"
-                res = requests.post(url, json=params)
-                data = res.json()
-            except requests.exceptions.ConnectionError:
+                token = get_client().create_submission(params)
+            except Judge0ConnectionError:
                 error_context = {
                     "result": "error",
                     "message": "Judge0 API seems to be down.",
                 }
                 return Response(error_context, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            # return error if no token
-            token = data.get("token")
-            if not token:
+            except Judge0Error:
                 error_context = {
                     "result": "error",
                     "message": "Judge0 error.",
                 }
                 return Response(error_context, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+            cache_pending_submission(digest, token)
+
             context = {
                 "result": "success",
                 "token": token,
@@ -321,11 +328,6 @@ def submit_single_test_case(request, test_case_id):
             "message": f"{ex}",
         } 
         return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
-    
-    finally:
-        # delete zip file
-        if os.path.exists('submission.zip'):
-            os.remove('submission.zip')
 
 
 @api_view(["GET"])
@@ -368,14 +370,17 @@ def get_tc_details(request):
             # call judge0
             try:
                 if status_only:
-                    url = f"{settings.JUDGE0_URL}/submissions/{token}?base64_encoded=false&fields=status_id"
+                    fields = "status_id"
                 elif vcd:
-                    url = f"{settings.JUDGE0_URL}/submissions/{token}?base64_encoded=false&fields=status_id,stdout,stderr,expected_output,vcd_output"
+                    fields = "status_id,stdout,stderr,expected_output,vcd_output,time,memory"
                 else:
-                    url = f"{settings.JUDGE0_URL}/submissions/{token}?base64_encoded=false&fields=status_id,stdin,stdout,expected_output,compile_output"
+                    fields = "status_id,stdin,stdout,expected_output,compile_output,time,memory"
 
-                res = requests.get(url)
-                data = res.json()
+                data = get_client().get_submission(token, fields)
+
+                # record the result of a "Compile and Run" submission, to be reused by identical submissions
+                if not status_only:
+                    cache_submission_result(token, data)
 
                 # append friendly status name
                 data['status'] = judge0_statuses[int(data['status_id'])]
@@ -392,7 +397,7 @@ def get_tc_details(request):
                 }
                 return Response(context, status=status.HTTP_200_OK)
 
-            except requests.exceptions.ConnectionError:
+            except Judge0ConnectionError:
                 error_context = {
                     "result": "error",
                     "message": "Judge0 API seems to be down.",
@@ -418,7 +423,8 @@ def code_question_submission(request, code_question_attempt_id):
     Algorithm:
     - Generates 'CodeQuestionSubmission' and 'TestCaseAttempt's and stores in the database.
     - Calls Judge0 api to submit the test cases
-    - Queues celery tasks for updating the statuses of TestCaseAttempt (by polling judge0)
+    - Judge0 pushes the results to judge0_callback, or if callbacks are disabled, the statuses of the TestCaseAttempts
+      are updated by the poll_pending_test_case_attempts periodic task
     """
     try:
         if request.method == "POST":
@@ -448,6 +454,9 @@ def code_question_submission(request, code_question_attempt_id):
             # get question type
             question_type = cqa.code_question.hdlquestionconfig.get_question_type()
 
+            # HDL zip files built for this submission, shared by test cases with the same testbench/module
+            bundles = {}
+
             # get code according to question type
             if question_type == 'Module and Testbench Design':
                 submissions = []
@@ -456,45 +465,59 @@ def code_question_submission(request, code_question_attempt_id):
                 testbench_code = request.POST.get('testbench_code')
 
                 # first test case is module code, others are testbench code
-                submissions.append(construct_judge0_params(testbench_code, language_id, test_cases[0]))
-                submissions.extend([construct_judge0_params(code, language_id, test_case) for test_case in test_cases[1:]])
+                submissions.append(construct_judge0_params(testbench_code, language_id, test_cases[0], bundles))
+                submissions.extend([construct_judge0_params(code, language_id, test_case, bundles) for test_case in test_cases[1:]])
             else:
                 code = request.POST.get('code')
-                submissions = [construct_judge0_params(code, language_id, test_case) for test_case in test_cases]
-            params = {"submissions": submissions}
+                submissions = [construct_judge0_params(code, language_id, test_case, bundles) for test_case in test_cases]
+
+            # ask judge0 to push the results to us when done
+            if callbacks_enabled():
+                url = callback_url()
+                for submission in submissions:
+                    submission["callback_url"] = url
+
+            # identical submissions that have already been executed are not sent to judge0 again
+            digests = [submission_digest(submission) for submission in submissions]
+            cached = get_cached_results(digests)
+            missing = [i for i, digest in enumerate(digests) if digest not in cached]
 
             # call judge0
             try:
-                url = settings.JUDGE0_URL + "/submissions/batch?base64_encoded=false"
-                res = requests.post(url, json=params)
-                data = res.json()
-            except ConnectionError:
+                tokens = get_client().create_submissions([submissions[i] for i in missing]) if missing else []
+            except Judge0ConnectionError:
                 error_context = {
                     "result": "error",
                     "message": "Judge0 API seems to be down.",
                 }
                 return Response(error_context, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            finally:
-                # delete zip file
-                if os.path.exists('submission.zip'):
-                    os.remove('submission.zip')
-            
-            # retrieve tokens from judge0 response
-            tokens = [x['token'] for x in data]
+            except Judge0Error:
+                error_context = {
+                    "result": "error",
+                    "message": "Judge0 error.",
+                }
+                return Response(error_context, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
             with transaction.atomic():
                 # create CodeQuestionSubmission
                 cqs = CodeQuestionSubmission.objects.create(cq_attempt=cqa, code=code,
                                                             language=Language.objects.get(judge_language_id=language_id))
                 
-                # create TestCaseAttempts
-                test_case_attempts = TestCaseAttempt.objects.bulk_create([
-                    TestCaseAttempt(cq_submission=cqs, test_case=tc, token=token) for tc, token in zip(test_cases, tokens)
-                ])
-
-            # queue celery tasks
-            for tca in test_case_attempts:
-                update_test_case_attempt_status.delay(tca.id, tca.token, 1)
+                # create TestCaseAttempts, the cached ones are already finished
+                tokens = dict(zip(missing, tokens))
+                test_case_attempts = []
+                for i, (tc, digest) in enumerate(zip(test_cases, digests)):
+                    if digest in cached:
+                        result = cached[digest]
+                        test_case_attempts.append(TestCaseAttempt(cq_submission=cqs, test_case=tc, token=result.token, status=result.status,
+                                                                  stdout=result.stdout, time=result.time, memory=result.memory, digest=digest))
+                    else:
+                        test_case_attempts.append(TestCaseAttempt(cq_submission=cqs, test_case=tc, token=tokens[i], digest=digest))
+                test_case_attempts = TestCaseAttempt.objects.bulk_create(test_case_attempts)
+
+            # all results were cached, no judge0 result will initiate the update of the submission
+            if not missing:
+                update_cqs_passed_flag.delay(cqs.id)
 
             context = {
                 "result": "success",
@@ -512,6 +535,37 @@ def code_question_submission(request, code_question_attempt_id):
         return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(["PUT"])
+@renderer_classes([JSONRenderer])
+@authentication_classes([])
+@permission_classes([])
+def judge0_callback(request):
+    """
+    Receives the result of a submission from Judge0 (callback_url of the submission).
+    Judge0 cannot log in, the request is authenticated by the key in the callback url instead.
+    If the TestCaseAttempt does not exist (yet), the result is ignored and the TestCaseAttempt will be
+    polled by poll_pending_test_case_attempts.
+    """
+    if not verify_callback_key(request.GET.get('key')):
+        return Response({"result": "error"}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        data = parse_callback(request.data)
+
+        if data['status_id'] not in [None, 1, 2]:
+            for tca in TestCaseAttempt.objects.filter(token=data['token'], status__in=[1, 2]):
+                save_test_case_attempt_result(tca, data)
+
+        return Response({"result": "success"}, status=status.HTTP_200_OK)
+
+    except Exception as ex:
+        error_context = {
+            "result": "error",
+            "message": f"{ex}",
+        }
+        return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(["GET"])
 @renderer_classes([JSONRenderer])
 @login_required()
@@ -565,19 +619,18 @@ def submit_assessment(request, assessment_attempt_id):
         if assessment_attempt.candidate != request.user:
             raise PermissionDenied()
 
-        # set time_submitted
-        if assessment_attempt.time_submitted is None:
-            assessment_attempt.auto_submit = False
-            assessment_attempt.time_submitted = timezone.now()
-            assessment_attempt.save()
-
+        # set time_submitted, unless the attempt has been submitted in the meantime (e.g. by
+        # force_submit_overdue_assessment_attempts)
+        submitted = AssessmentAttempt.objects.filter(id=assessment_attempt.id, time_submitted=None) \
+            .update(auto_submit=False, time_submitted=timezone.now())
+        if submitted:
             # queue celery task to compute the assessment attempt's score (using results from test cases)
             compute_assessment_attempt_score.delay(assessment_attempt.id)
 
             messages.success(request, "Assessment submitted successfully!")
 
         else:
-            return PermissionDenied()
+            raise PermissionDenied()
 
         return redirect('assessment-landing', assessment_id=assessment_attempt.assessment.id)
 
@@ -588,7 +641,7 @@ def submit_assessment(request, assessment_attempt_id):
 @groups_allowed(UserGroup.educator, UserGroup.lab_assistant, UserGroup.student)
 def upload_snapshot(request, assessment_attempt_id):
     """
-    Uploads candidate snapshots to MEDIA_ROOT/<course>/<test_name>/<username>/<attempt_number>/<filename>
+    Uploads candidate snapshots to <storage>/<course>/<test_name>/<username>/<attempt_number>/<filename>
     when candidate snapshots are:
     1. captured as initial.png on assessment-landing page
     2. auto-captured as <timestamp>.png at randomised intervals on code-question-attempt page
@@ -604,18 +657,18 @@ def upload_snapshot(request, assessment_attempt_id):
             image = request.FILES['image']
 
             snapshot = CandidateSnapshot(assessment_attempt=assessment_attempt, 
-                                        attempt_number=attempt_number, timestamp=timestamp_tz, image=image)
+                                        attempt_number=attempt_number, timestamp=timestamp_tz)
+            ingest_snapshot(snapshot, image)
             snapshot.save()
 
             """ 
-            if celery worker container is running on a machine that's different from dev machine, use local_detect_faces instead of detect_faces.delay.
-            cannot queue as task because MEDIA_ROOT are different directories
+            faces are detected by the periodic detect_faces_pending_snapshots task, which reads the snapshot through the storage.
+            if the files are stored in MEDIA_ROOT and the celery worker runs on a machine that does not share this directory,
+            configure an S3 compatible storage (see settings.py) or use local_detect_faces instead.
             """
             # if settings.DEBUG:
             #     local_detect_faces(snapshot)
 
-            detect_faces.delay(snapshot.id)
-
             context = {
                 "faces_detected": snapshot.faces_detected,
             }
@@ -630,34 +683,34 @@ def upload_snapshot(request, assessment_attempt_id):
 
 
 def local_detect_faces(snapshot):
-    image_path = os.path.join(settings.MEDIA_ROOT, snapshot.image.name)
-
-    model_pack_name = "buffalo_sc"
-    app = FaceAnalysis(name=model_pack_name)
-    app.prepare(ctx_id=0, det_size=(640, 640))
-    image = cv2.imread(image_path)
-    faces = app.get(image)
-
-    snapshot.faces_detected = len(faces)
+    image = read_image(snapshot.image)
+    snapshot.faces_detected = count_faces(image)
     snapshot.save()
+    update_proctoring_counts([snapshot])
 
 
 @api_view(["POST"])
 @renderer_classes([JSONRenderer])
 def detect_faces_initial(request):
+    """
+    Detects the faces in the initial snapshot (taken on the assessment landing page), before the attempt is started.
+    The detection runs in the detection process pool (see core.face_detection), if the pool is busy or the detection
+    takes too long, the candidate is asked to try again.
+    """
     try:
         image = request.FILES['image']
-        model_pack_name = "buffalo_sc"
-        app = FaceAnalysis(name=model_pack_name)
-        app.prepare(ctx_id=0, det_size=(640, 640))
-        image_bytes = image.read()
-        image_np = np.frombuffer(image_bytes, dtype=np.uint8)
-        img = cv2.imdecode(image_np, cv2.IMREAD_UNCHANGED)
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        faces = app.get(img)
+
+        try:
+            faces_detected = count_faces_in_upload(image.read())
+        except (DetectionPoolBusy, FutureTimeoutError):
+            error_context = {
+                "result": "error",
+                "message": "Face detection is busy, please try again.",
+            }
+            return Response(error_context, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
         context = {
-            "faces_detected": len(faces),
+            "faces_detected": faces_detected,
         }
         return Response(context, status=status.HTTP_200_OK)
 
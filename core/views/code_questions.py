@@ -1,10 +1,5 @@
 import re
-import zipfile
-import base64
-import os
-import requests
 
-from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
@@ -19,10 +14,11 @@ from rest_framework.renderers import JSONRenderer
 
 from core.decorators import groups_allowed, UserGroup
 from core.forms.question_banks import CodeQuestionForm, ModuleGenerationForm, QuestionSolutionForm, QuestionTypeForm
+from core.judge0 import get_client, Judge0Error, Judge0ConnectionError
 from core.models import QuestionBank, Assessment, CodeQuestion
 from core.models.questions import HDLQuestionConfig, TestCase, CodeSnippet, Language, Tag
 from core.serializers import CodeQuestionsSerializer
-from core.views.utils import TestbenchGenerator, check_permissions_course, check_permissions_code_question, embed_inout_module, embed_inout_testbench, generate_module
+from core.views.utils import TestbenchGenerator, build_hdl_bundle, check_permissions_course, check_permissions_code_question, embed_inout_module, embed_inout_testbench, generate_module
 
 
 @login_required()
@@ -574,38 +570,22 @@ def compile_code(request):
                 except Exception as ex:
                     pass
             
-            # create zip file
-            with zipfile.ZipFile('submission.zip', 'w') as zip_file:
-                zip_file.writestr('main.v', module)
-                zip_file.writestr('testbench.v', testbench)
-                zip_file.writestr('compile', 'iverilog -o a.out main.v testbench.v')
-                zip_file.writestr('run', "vvp -n a.out | find -name '*.vcd' -exec python3 -m vcd2wavedrom.vcd2wavedrom --aasp -i {} + | tr -d '[:space:]'")
-
-            # encode zip file
-            with open('submission.zip', 'rb') as f:
-                encoded = base64.b64encode(f.read()).decode('utf-8')
-
             # judge0 params
             params = {
-                "additional_files": encoded,
+                "additional_files": build_hdl_bundle(module, testbench),
                 "language_id": request.POST.get('lang-id'),
             }
             
             # call judge0
             try:
-                url = settings.JUDGE0_URL + "/submissions/?base64_encoded=false&wait=false"
-                res = requests.post(url, json=params)
-                data = res.json()
-            except requests.exceptions.ConnectionError:
+                token = get_client().create_submission(params)
+            except Judge0ConnectionError:
                 error_context = {
                     "result": "error",
                     "message": "Judge0 API seems to be down.",
                 }
                 return Response(error_context, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            # return error if no token
-            token = data.get("token")
-            if not token:
+            except Judge0Error:
                 error_context = {
                     "result": "error",
                     "message": "Judge0 error.",
@@ -624,8 +604,3 @@ def compile_code(request):
             "message": f"{ex}",
         } 
         return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
-    
-    finally:
-        # delete zip file
-        if os.path.exists('submission.zip'):
-            os.remove('submission.zip')
@@ -1,20 +1,30 @@
-import csv
+import os
+from datetime import timedelta
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
-from django.db.models import Q
-from django.http import HttpResponse, Http404
+from django.db import IntegrityError
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.http import FileResponse, HttpResponse, Http404
 from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from django.utils.text import slugify
+from django.views.decorators.http import condition
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.renderers import JSONRenderer
 
 from core.decorators import UserGroup, groups_allowed
-from core.models import Assessment, AssessmentAttempt, CodeQuestionSubmission, TestCaseAttempt, TestCase, CandidateSnapshot
-from core.views.utils import check_permissions_assessment
+from core.models import Assessment, AssessmentAttempt, AssessmentStatistics, CodeQuestion, CodeQuestionSubmission, TestCaseAttempt, TestCase, CandidateSnapshot, \
+    ReportJob
+from core.plagiarism import similar_pairs
+from core.reports import breakdown_csv, breakdown_json, results_csv, submissions_zip_chunks
+from core.tasks import build_report
+from core.views.utils import check_permissions_assessment, stream_csv, stream_json, stream_zip
 
 
 @login_required()
@@ -22,22 +32,157 @@ from core.views.utils import check_permissions_assessment
 def assessment_report(request, assessment_id):
     assessment = get_object_or_404(Assessment, id=assessment_id)
 
-    best_attempts = AssessmentAttempt.objects \
-                    .select_related("assessment") \
-                    .filter(assessment=assessment, best_attempt=True).order_by("-score")
-    ongoing_ungraded_attempts = AssessmentAttempt.objects \
-                                .select_related("assessment") \
-                                .filter(Q(assessment=assessment, time_submitted__isnull=True) | Q(time_submitted__isnull=False, score__isnull=True))
+    # the best attempts and the ongoing/processing attempts are loaded by the page, see get_best_attempts and
+    # get_ongoing_attempts
+    # precomputed statistics of the best attempts, updated as the attempts are scored
+    statistics = AssessmentStatistics.for_assessment(assessment)
+    histogram = statistics.histogram()
+    max_count = max((count for _, _, count in histogram), default=0)
 
     context = {
         "assessment": assessment,
-        "best_attempts": best_attempts,
-        "ongoing_ungraded_attempts": ongoing_ungraded_attempts,
+        "statistics": statistics,
+        "percentiles": {percent: statistics.percentile(percent) for percent in (25, 50, 75, 90)},
+        "histogram": [{"low": low, "high": high, "count": count, "width": round(count / max_count * 100) if max_count else 0}
+                      for low, high, count in histogram],
+        "question_statistics": statistics.questions(),
+        "report_choices": ReportJob.Reports.choices,
     }
 
     return render(request, "reports/assessment-report.html", context)
 
 
+def attempt_rows(assessment, attempts):
+    """
+    Rows of the report tables of a queryset of AssessmentAttempts, from a single query: the candidate, the number of
+    attempts of the candidate and the proctoring flags are read along with each attempt.
+    """
+    total_attempts = AssessmentAttempt.objects.filter(assessment=assessment, candidate=OuterRef("candidate")) \
+        .order_by().values("candidate").annotate(count=Count("id")).values("count")
+    attempts = attempts.annotate(total_attempts=Subquery(total_attempts)) \
+        .values("id", "candidate_id", "candidate__username", "time_started",
+                "time_submitted", "score", "best_attempt", "total_attempts", "multiple_faces_count", "no_faces_count")
+
+    rows = []
+    for attempt in attempts:
+        rows.append({
+            "id": attempt["id"],
+            "candidate_id": attempt["candidate_id"],
+            "username": attempt["candidate__username"],
+            "time_started": attempt["time_started"],
+            "time_submitted": attempt["time_submitted"],
+            "duration": AssessmentAttempt.format_duration(attempt["time_started"], attempt["time_submitted"]),
+            "score": attempt["score"],
+            "best_attempt": attempt["best_attempt"],
+            "total_attempts": attempt["total_attempts"],
+            # see AssessmentAttempt.status
+            "status": "Ongoing" if attempt["time_submitted"] is None else "Processing" if attempt["score"] is None else "Finished",
+            # see AssessmentAttempt.multiple_faces_detected and no_faces_detected
+            "multiple_faces_detected": attempt["multiple_faces_count"] > 0 if assessment.require_webcam else None,
+            "no_faces_detected": attempt["no_faces_count"] > 0 if assessment.require_webcam else None,
+        })
+    return rows
+
+
+def keyset_page(request, attempts, keys):
+    """
+    Page of a queryset of AssessmentAttempts ordered by keys (fields, "-" for descending, the last one "id"), after the
+    cursor of the previous page (values of the keys of its last row, "after" parameter). Unlike offsets, each page is a
+    single indexed range query, however deep it is.
+    Returns the ids of the page and the cursor of the next page (None on the last page).
+    """
+    limit = min(int(request.GET.get("limit", settings.REPORT_PAGE_SIZE)), settings.REPORT_PAGE_SIZE)
+    attempts = attempts.order_by(*keys)
+
+    after = request.GET.get("after")
+    if after:
+        values = [int(value) for value in after.split("_")]
+        if len(values) != len(keys):
+            raise ValueError("Invalid cursor.")
+
+        # rows after the cursor: (k1 > v1) or (k1 = v1 and k2 > v2) or ...
+        condition = Q()
+        for index, key in enumerate(keys):
+            equal = Q(**{previous_key.lstrip("-"): value for previous_key, value in zip(keys[:index], values[:index])})
+            condition |= equal & Q(**{f"{key.lstrip('-')}__{'lt' if key.startswith('-') else 'gt'}": values[index]})
+        attempts = attempts.filter(condition)
+
+    fields = [key.lstrip("-") for key in keys]
+    page = list(attempts.values_list(*fields)[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = "_".join(str(value) for value in page[-1])
+    return [row[-1] for row in page], next_cursor
+
+
+@api_view(["GET"])
+@renderer_classes([JSONRenderer])
+@login_required()
+@groups_allowed(UserGroup.educator)
+def get_best_attempts(request, assessment_id):
+    """
+    Best attempt of each candidate, by score (highest first), a page at a time (see keyset_page).
+    """
+    assessment = get_object_or_404(Assessment, id=assessment_id)
+
+    # check permissions
+    if check_permissions_assessment(assessment, request.user) == 0:
+        raise PermissionDenied("You do not have permissions to this assessment.")
+
+    try:
+        attempts = AssessmentAttempt.objects.filter(assessment=assessment, best_attempt=True, score__isnull=False)
+        page, next_cursor = keyset_page(request, attempts, ["-score", "id"])
+
+        context = {
+            "result": "success",
+            "rows": attempt_rows(assessment, AssessmentAttempt.objects.filter(id__in=page).order_by("-score", "id")),
+            "next": next_cursor,
+        }
+        return Response(context, status=status.HTTP_200_OK)
+
+    except Exception as ex:
+        error_context = {
+            "result": "error",
+            "message": f"{ex}",
+        }
+        return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["GET"])
+@renderer_classes([JSONRenderer])
+@login_required()
+@groups_allowed(UserGroup.educator)
+def get_ongoing_attempts(request, assessment_id):
+    """
+    Attempts that have not been submitted, or are still being graded, a page at a time (see keyset_page).
+    """
+    assessment = get_object_or_404(Assessment, id=assessment_id)
+
+    # check permissions
+    if check_permissions_assessment(assessment, request.user) == 0:
+        raise PermissionDenied("You do not have permissions to this assessment.")
+
+    try:
+        attempts = AssessmentAttempt.objects.filter(assessment=assessment) \
+            .filter(Q(time_submitted__isnull=True) | Q(score__isnull=True))
+        page, next_cursor = keyset_page(request, attempts, ["id"])
+
+        context = {
+            "result": "success",
+            "rows": attempt_rows(assessment, AssessmentAttempt.objects.filter(id__in=page).order_by("id")),
+            "next": next_cursor,
+        }
+        return Response(context, status=status.HTTP_200_OK)
+
+    except Exception as ex:
+        error_context = {
+            "result": "error",
+            "message": f"{ex}",
+        }
+        return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(["GET"])
 @renderer_classes([JSONRenderer])
 @login_required()
@@ -50,32 +195,15 @@ def get_candidate_attempts(request, assessment_id):
             return Response({ "result": "error" }, status=status.HTTP_400_BAD_REQUEST)
 
         assessment = get_object_or_404(Assessment, id=assessment_id)
-        # get assessment attempts
+        # get assessment attempts (with the proctoring flags if the assessment requires the webcam)
         assessment_attempts = AssessmentAttempt.objects \
-                            .select_related("assessment") \
                             .filter(assessment=assessment, candidate__id=candidate_id, time_submitted__isnull=False) \
                             .order_by("id")
-        
-        if assessment.require_webcam:
-            list_assessment_attempts = list()
-            for attempt in assessment_attempts:
-                values = { 
-                    "id": attempt.id,
-                    "time_started": attempt.time_started,
-                    "time_submitted": attempt.time_submitted,
-                    "score": attempt.score,
-                    "best_attempt": attempt.best_attempt,
-                    "multiple_faces_detected": attempt.multiple_faces_detected,
-                    "no_faces_detected": attempt.no_faces_detected 
-                }
-                list_assessment_attempts.append(values)
-        else:
-            list_assessment_attempts = list(assessment_attempts.values())
-        
+
         # prepare context
         context = {
             "result": "success",
-            "assessment_attempts": list_assessment_attempts,
+            "assessment_attempts": attempt_rows(assessment, assessment_attempts),
         }
         return Response(context, status=status.HTTP_200_OK)
 
@@ -163,53 +291,286 @@ def export_assessment_results(request, assessment_id):
     if check_permissions_assessment(assessment, request.user) == 0:
         raise PermissionDenied("You do not have permissions to this assessment.")
 
-    # get all attempts by score
-    all_attempts = AssessmentAttempt.objects.filter(assessment__id=assessment_id,
-                                                    time_submitted__isnull=False).prefetch_related("candidate")
-
-    # create the HttpResponse object with the appropriate CSV header.
+    # submitted attempts, read from the database in chunks while the file is sent
     filename = slugify(f"{assessment.course.code}_{assessment.name}_{timezone.now().strftime('%Y%m%d-%H%M')}")
-    response = HttpResponse(
-        content_type='text/csv',
-        headers={'Content-Disposition': f'attachment; filename="{filename}.csv"'},
-    )
-
-    # columns: username, time_started, time_submitted, auto_submit, score
-    writer = csv.writer(response)
-    writer.writerow(["username", "score", "best_attempt", "time_started", "time_submitted", "auto_submit"])
-
-    for attempt in all_attempts:
-        writer.writerow([attempt.candidate.username,
-                         attempt.score,
-                         'Y' if attempt.best_attempt else 'N',
-                         attempt.time_started,
-                         attempt.time_submitted,
-                         'Y' if attempt.auto_submit else 'N'])
+    return stream_csv(filename, *results_csv(assessment))
 
-    return response
+
+@login_required()
+@groups_allowed(UserGroup.educator)
+def export_assessment_breakdown(request, assessment_id):
+    """
+    Exports the score of each code question of the submitted attempts (best submission of each question), and of each
+    test case if test_cases=1, as CSV (default) or JSON with format=json.
+    """
+    # check that assessment exist
+    assessment = get_object_or_404(Assessment.objects.select_related("course"), id=assessment_id)
+
+    # check permissions
+    if check_permissions_assessment(assessment, request.user) == 0:
+        raise PermissionDenied("You do not have permissions to this assessment.")
+
+    test_cases = request.GET.get("test_cases") == "1"
+    filename = slugify(f"{assessment.course.code}_{assessment.name}_breakdown_{timezone.now().strftime('%Y%m%d-%H%M')}")
+
+    if request.GET.get("format") == "json":
+        return stream_json(filename, *breakdown_json(assessment, test_cases))
+
+    return stream_csv(filename, *breakdown_csv(assessment, test_cases))
+
+
+@login_required()
+@groups_allowed(UserGroup.educator)
+def export_assessment_submissions(request, assessment_id):
+    """
+    Exports the code of all the submissions of the submitted attempts as a ZIP file, written while it is sent.
+    """
+    # check that assessment exist
+    assessment = get_object_or_404(Assessment.objects.select_related("course"), id=assessment_id)
+
+    # check permissions
+    if check_permissions_assessment(assessment, request.user) == 0:
+        raise PermissionDenied("You do not have permissions to this assessment.")
+
+    filename = slugify(f"{assessment.course.code}_{assessment.name}_submissions_{timezone.now().strftime('%Y%m%d-%H%M')}")
+    return stream_zip(filename, submissions_zip_chunks(assessment))
+
+
+@api_view(["GET"])
+@renderer_classes([JSONRenderer])
+@login_required()
+@groups_allowed(UserGroup.educator)
+def get_similar_submissions(request, code_question_id):
+    """
+    Pairs of candidates with similar submissions to a code question of an assessment (plagiarism screening, see
+    core.plagiarism), ranked by overlap.
+    """
+    code_question = get_object_or_404(CodeQuestion.objects.select_related("assessment"), id=code_question_id, assessment__isnull=False)
+
+    # check permissions
+    if check_permissions_assessment(code_question.assessment, request.user) == 0:
+        raise PermissionDenied("You do not have permissions to this assessment.")
+
+    try:
+        limit = int(request.GET.get("limit", 50))
+        context = {
+            "result": "success",
+            "pairs": similar_pairs(code_question, limit=limit),
+        }
+        return Response(context, status=status.HTTP_200_OK)
+
+    except Exception as ex:
+        error_context = {
+            "result": "error",
+            "message": f"{ex}",
+        }
+        return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
+
+
+def report_job_context(job) -> dict:
+    return {
+        "id": job.id,
+        "report": job.get_report_display(),
+        "status": job.get_status_display(),
+        "progress": job.progress,
+        "error": job.error,
+        "download_url": reverse("download-report", args=[job.id]) if job.status == ReportJob.Statuses.DONE else None,
+    }
+
+
+@api_view(["POST"])
+@renderer_classes([JSONRenderer])
+@login_required()
+@groups_allowed(UserGroup.educator)
+def create_report_job(request, assessment_id):
+    """
+    Starts building a report of the assessment in the background (see core.tasks.build_report).
+    The report of the current version of the data is reused if it has already been built (or is being built). Failed
+    jobs, and jobs without progress for REPORT_JOB_TIMEOUT seconds (lost by a worker), are queued again.
+    """
+    assessment = get_object_or_404(Assessment, id=assessment_id)
+
+    # check permissions
+    if check_permissions_assessment(assessment, request.user) == 0:
+        raise PermissionDenied("You do not have permissions to this assessment.")
+
+    try:
+        report = request.POST.get("report")
+        if report not in ReportJob.Reports.values:
+            raise ValueError("Invalid report.")
+
+        # new data (attempts scored) has a new version
+        statistics = AssessmentStatistics.for_assessment(assessment)
+        try:
+            job, created = ReportJob.objects.get_or_create(assessment=assessment, report=report, data_version=statistics.version,
+                                                           defaults={"created_by": request.user})
+        except IntegrityError:
+            # created by a concurrent request
+            job, created = ReportJob.objects.get(assessment=assessment, report=report, data_version=statistics.version), False
+
+        lost = job.status in [ReportJob.Statuses.PENDING, ReportJob.Statuses.RUNNING] \
+            and job.time_updated < timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT)
+        if not created and (job.status == ReportJob.Statuses.FAILED or lost):
+            # conditional update, the job is only queued again by one of the concurrent requests
+            created = ReportJob.objects.filter(id=job.id, status=job.status, time_updated=job.time_updated) \
+                .update(status=ReportJob.Statuses.PENDING, error=None, processed=0, time_updated=timezone.now())
+            job.refresh_from_db()
+
+        if created:
+            build_report.delay(job.id)
+
+        context = {
+            "result": "success",
+            "report_job": report_job_context(job),
+        }
+        return Response(context, status=status.HTTP_200_OK)
+
+    except Exception as ex:
+        error_context = {
+            "result": "error",
+            "message": f"{ex}",
+        }
+        return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["GET"])
+@renderer_classes([JSONRenderer])
+@login_required()
+@groups_allowed(UserGroup.educator)
+def get_report_job(request, report_job_id):
+    """
+    Status and progress of a report job, polled until the report can be downloaded.
+    A job that has not been built yet is replaced by the latest version of the same report if there is one (new data),
+    the page then polls the returned job instead.
+    """
+    job = get_object_or_404(ReportJob.objects.select_related("assessment"), id=report_job_id)
+
+    # check permissions
+    if check_permissions_assessment(job.assessment, request.user) == 0:
+        raise PermissionDenied("You do not have permissions to this assessment.")
+
+    if job.status != ReportJob.Statuses.DONE:
+        job = ReportJob.objects.filter(assessment=job.assessment, report=job.report, data_version__gte=job.data_version) \
+            .order_by("-data_version").first() or job
+
+    context = {
+        "result": "success",
+        "report_job": report_job_context(job),
+    }
+    return Response(context, status=status.HTTP_200_OK)
+
+
+@login_required()
+@groups_allowed(UserGroup.educator)
+def download_report(request, report_job_id):
+    job = get_object_or_404(ReportJob.objects.select_related("assessment"), id=report_job_id, status=ReportJob.Statuses.DONE)
+
+    # check permissions
+    if check_permissions_assessment(job.assessment, request.user) == 0:
+        raise PermissionDenied("You do not have permissions to this assessment.")
+
+    # read through the storage, the file is not public
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=os.path.basename(job.file.name))
+
+
+# categories of the snapshot review gallery, computed by the database
+SNAPSHOT_FILTERS = {
+    "all": Q(),
+    "multiple_faces": Q(faces_detected__gt=1) & ~Q(image__contains="initial"),
+    "no_face": Q(faces_detected=0),
+}
 
 
 @login_required()
 @groups_allowed(UserGroup.educator, UserGroup.lab_assistant)
 def candidate_snapshots(request):
-    assessment_attempt_id = request.GET.get("attempt_id")
-    all_snapshots = CandidateSnapshot.objects.filter(assessment_attempt__id=assessment_attempt_id).order_by("timestamp")
+    assessment_attempt = get_object_or_404(AssessmentAttempt.objects.select_related("candidate", "assessment__course"),
+                                           id=request.GET.get("attempt_id"))
+
+    # number of snapshots of each category, from a single query. the snapshots are loaded by the page, see
+    # get_candidate_snapshots
+    counts = CandidateSnapshot.objects.filter(assessment_attempt=assessment_attempt) \
+        .aggregate(**{name: Count("id", filter=snapshot_filter) for name, snapshot_filter in SNAPSHOT_FILTERS.items()})
+    if counts["all"] == 0:
+        raise Http404()
 
-    if all_snapshots.exists():
-        multiple_faces = all_snapshots.filter(faces_detected__gt=1).exclude(image__contains="initial")
-        missing_face = all_snapshots.filter(faces_detected=0)
-        assessment_attempt = all_snapshots.first().assessment_attempt
-        candidate = assessment_attempt.candidate
+    context = {
+        "candidate": assessment_attempt.candidate,
+        "assessment_attempt": assessment_attempt,
+        "counts": counts,
+    }
+    return render(request, "reports/candidate-snapshots.html", context)
+
+
+@api_view(["GET"])
+@renderer_classes([JSONRenderer])
+@login_required()
+@groups_allowed(UserGroup.educator, UserGroup.lab_assistant)
+def get_candidate_snapshots(request, assessment_attempt_id):
+    """
+    Snapshots of an assessment attempt in order, a page (at most SNAPSHOT_PAGE_SIZE) at a time: the snapshots after the
+    "after" snapshot, of the "filter" category (SNAPSHOT_FILTERS). Only the thumbnails are shown by the gallery, the
+    images are opened on demand.
+    """
+    try:
+        if request.GET.get("filter", "all") not in SNAPSHOT_FILTERS:
+            raise ValueError("Invalid filter.")
+        snapshot_filter = SNAPSHOT_FILTERS[request.GET.get("filter", "all")]
+        limit = min(int(request.GET.get("limit", settings.SNAPSHOT_PAGE_SIZE)), settings.SNAPSHOT_PAGE_SIZE)
+
+        snapshots = CandidateSnapshot.objects.filter(snapshot_filter, assessment_attempt_id=assessment_attempt_id) \
+            .order_by("timestamp", "id")
+        after = request.GET.get("after")
+        if after:
+            # snapshots after the cursor, in (timestamp, id) order
+            after_timestamp = CandidateSnapshot.objects.filter(id=int(after)).values("timestamp")
+            snapshots = snapshots.filter(Q(timestamp__gt=Subquery(after_timestamp)) |
+                                         Q(timestamp=Subquery(after_timestamp), id__gt=int(after)))
+
+        page = list(snapshots.only("id", "timestamp", "image", "thumbnail", "faces_detected", "detection_skipped")[:limit + 1])
+        rows = [{
+            "id": snapshot.id,
+            "timestamp": snapshot.timestamp,
+            "initial": "initial" in snapshot.image.name,
+            "faces_detected": snapshot.faces_detected,
+            "detection_skipped": snapshot.detection_skipped,
+            "thumbnail_url": reverse("snapshot-thumbnail", args=[snapshot.id]),
+            "image_url": snapshot.image.url if snapshot.image else None,
+        } for snapshot in page[:limit]]
 
         context = {
-            "candidate": candidate,
-            "assessment_attempt": assessment_attempt,
-            "all_snapshots": all_snapshots,
-            "multiple_faces": multiple_faces,
-            "missing_face": missing_face,
+            "result": "success",
+            "snapshots": rows,
+            "next": rows[-1]["id"] if len(page) > limit else None,
+        }
+        return Response(context, status=status.HTTP_200_OK)
+
+    except Exception as ex:
+        error_context = {
+            "result": "error",
+            "message": f"{ex}",
         }
-        
-        return render(request, "reports/candidate-snapshots.html", context)
-    
-    else:
-        raise Http404()
\ No newline at end of file
+        return Response(error_context, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _snapshot_thumbnail_etag(request, snapshot_id):
+    name = CandidateSnapshot.objects.filter(id=snapshot_id).values_list("thumbnail", flat=True).first()
+    return f"{snapshot_id}-{name}" if name is not None else None
+
+
+@login_required()
+@groups_allowed(UserGroup.educator, UserGroup.lab_assistant)
+@condition(etag_func=_snapshot_thumbnail_etag)
+def snapshot_thumbnail(request, snapshot_id):
+    """
+    Thumbnail of a snapshot (the image if it has none), read through the storage. The files of a snapshot never
+    change, browsers keep them for SNAPSHOT_THUMBNAIL_MAX_AGE seconds and revalidate them with their ETag.
+    """
+    snapshot = get_object_or_404(CandidateSnapshot.objects.only("id", "image", "thumbnail"), id=snapshot_id)
+    field = snapshot.thumbnail if snapshot.thumbnail else snapshot.image
+    if not field:
+        raise Http404()
+
+    response = FileResponse(field.open('rb'))
+    patch_cache_control(response, private=True, max_age=settings.SNAPSHOT_THUMBNAIL_MAX_AGE)
+    return response
\ No newline at end of file
@@ -1,12 +1,15 @@
+import io
 import zipfile
 import base64
 import re
 
+from django.http import StreamingHttpResponse
 from vcdvcd.vcdvcd import VCDVCD
 from math import floor, ceil
 
 from core.models import CodeQuestionAttempt, CourseGroup, User
 from core.models.questions import Language
+from core.reports import csv_chunks, json_chunks
 from core.tasks import send_assessment_published_email
 
 
@@ -63,6 +66,41 @@ def clean_csv(rows):
     return cleaned2, removed
 
 
+def stream_csv(filename, header, rows) -> StreamingHttpResponse:
+    """
+    CSV file download whose rows (iterable of lists) are written while the response is sent, instead of being built
+    in memory first. Rows should come from a queryset .iterator() for the memory to stay flat.
+    """
+    return StreamingHttpResponse(
+        csv_chunks(header, rows),
+        content_type='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}.csv"'},
+    )
+
+
+def stream_json(filename, fields, key, items) -> StreamingHttpResponse:
+    """
+    JSON file download of an object with the given fields, and a list (under key) whose items are serialized while the
+    response is sent, instead of being built in memory first.
+    """
+    return StreamingHttpResponse(
+        json_chunks(fields, key, items),
+        content_type='application/json',
+        headers={'Content-Disposition': f'attachment; filename="{filename}.json"'},
+    )
+
+
+def stream_zip(filename, chunks) -> StreamingHttpResponse:
+    """
+    ZIP file download whose parts (bytes) are sent as they are written, see core.reports.ZipStream.
+    """
+    return StreamingHttpResponse(
+        chunks,
+        content_type='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}.zip"'},
+    )
+
+
 def check_permissions_course(course, user):
     """
     Returns the permission level of a user for this course.
@@ -178,10 +216,41 @@ def construct_assessment_published_email(assessment, recipients=None):
     send_assessment_published_email.delay(assessment.id, assessment.name, str(assessment.course),\
                                           assessment.time_start, assessment.time_end, assessment.duration, recipients)
 
-def construct_judge0_params(code, lang_id, test_case) -> dict:
+def build_hdl_bundle(main, testbench) -> str:
+    """
+    Builds the zip file of a Verilog submission (main.v, testbench.v, compile and run scripts) in memory.
+    Returns the zip file encoded in base64, as expected by the "additional_files" parameter of Judge0.
+    """
+    files = [
+        ('main.v', main),
+        ('testbench.v', testbench),
+        ('compile', 'iverilog -o a.out main.v testbench.v'),
+        ('run', "vvp -n a.out | find -name '*.vcd' -exec python3 -m vcd2wavedrom.vcd2wavedrom --aasp -i {} + | tr -d '[:space:]'"),
+    ]
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zip_file:
+        for name, content in files:
+            # fixed timestamp (writestr stamps the current time), so that the same code gives the same zip file and the
+            # same digest, see core.judge0.submission_digest
+            info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+            info.external_attr = 0o600 << 16
+            zip_file.writestr(info, content)
+
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def construct_judge0_params(code, lang_id, test_case, bundles=None) -> dict:
     """
     Constructs the parameters needed to send to Judge0 API.
     Hardware description languages require a different set up, where the code is zipped and sent to Judge0.
+
+    Parameters:
+    -----------
+    bundles : dict, optional
+        cache of the zip files already built for this submission, keyed by (code, stdin).
+        pass the same dict when constructing the params of every test case of a submission, so that test cases with
+        the same testbench/module share a single zip file.
     """
     if test_case.code_question.is_software_language() == True:
         # judge0 params
@@ -194,57 +263,54 @@ def construct_judge0_params(code, lang_id, test_case) -> dict:
             "memory_limit": test_case.memory_limit,
         }
     else:
-        # check if language is verilog
-        language = Language.objects.get(judge_language_id=lang_id)
-        if language.name.find('Verilog') != -1:
-            if code.find('$dumpfile') == -1 and test_case.stdin.find('$dumpfile') == -1:
-                # add wave dump to testbench
-                # find testbench file
-                if code.find('initial') != -1:
-                    # add wave dump to last line before endmodule
-                    testbench = code.replace('endmodule', 'initial begin $dumpfile("vcd_dump.vcd"); $dumpvars(0); end endmodule')
-                    main = test_case.stdin
-                elif test_case.stdin.find('initial') != -1:
-                    # add wave dump to last line before endmodule
-                    main = code
-                    testbench = test_case.stdin.replace('endmodule', 'initial begin $dumpfile("vcd_dump.vcd"); $dumpvars(0); end endmodule')
-            else:
-                # Define the regular expression patterns
-                dumpfile_pattern = r'\$dumpfile\("[^"]+"\)'
-                dumpvars_pattern = r'\$dumpvars\(\d+\)'
-
-                # Replacement strings
-                new_dumpfile = '$dumpfile("vcd_dump.vcd")'
-                new_dumpvars = '$dumpvars(0)'
-
-                if code.find('initial') != -1:
-                    # replace wave dump
-                    testbench = re.sub(dumpfile_pattern, new_dumpfile, code)
-                    testbench = re.sub(dumpvars_pattern, new_dumpvars, testbench)
-                    main = test_case.stdin
-                elif test_case.stdin.find('initial') != -1:
-                    # replace wave dump
-                    testbench = re.sub(dumpfile_pattern, new_dumpfile, test_case.stdin)
-                    testbench = re.sub(dumpvars_pattern, new_dumpvars, testbench)
-                    main = code
-
-        try:
-            main, input_ports, output_ports = embed_inout_module(main)
-            testbench = embed_inout_testbench(testbench, input_ports, output_ports)
-        except:
-            main = code
-            testbench = test_case.stdin
-        
-        # create zip file
-        with zipfile.ZipFile('submission.zip', 'w') as zip_file:
-            zip_file.writestr('main.v', main)
-            zip_file.writestr('testbench.v', testbench)
-            zip_file.writestr('compile', 'iverilog -o a.out main.v testbench.v')
-            zip_file.writestr('run', "vvp -n a.out | find -name '*.vcd' -exec python3 -m vcd2wavedrom.vcd2wavedrom --aasp -i {} + | tr -d '[:space:]'")
-        
-        # encode zip file
-        with open('submission.zip', 'rb') as f:
-            encoded = base64.b64encode(f.read()).decode('utf-8')
+        bundle_key = (code, test_case.stdin)
+        if bundles is not None and bundle_key in bundles:
+            encoded = bundles[bundle_key]
+        else:
+            # check if language is verilog
+            language = Language.objects.get(judge_language_id=lang_id)
+            if language.name.find('Verilog') != -1:
+                if code.find('$dumpfile') == -1 and test_case.stdin.find('$dumpfile') == -1:
+                    # add wave dump to testbench
+                    # find testbench file
+                    if code.find('initial') != -1:
+                        # add wave dump to last line before endmodule
+                        testbench = code.replace('endmodule', 'initial begin $dumpfile("vcd_dump.vcd"); $dumpvars(0); end endmodule')
+                        main = test_case.stdin
+                    elif test_case.stdin.find('initial') != -1:
+                        # add wave dump to last line before endmodule
+                        main = code
+                        testbench = test_case.stdin.replace('endmodule', 'initial begin $dumpfile("vcd_dump.vcd"); $dumpvars(0); end endmodule')
+                else:
+                    # Define the regular expression patterns
+                    dumpfile_pattern = r'\$dumpfile\("[^"]+"\)'
+                    dumpvars_pattern = r'\$dumpvars\(\d+\)'
+
+                    # Replacement strings
+                    new_dumpfile = '$dumpfile("vcd_dump.vcd")'
+                    new_dumpvars = '$dumpvars(0)'
+
+                    if code.find('initial') != -1:
+                        # replace wave dump
+                        testbench = re.sub(dumpfile_pattern, new_dumpfile, code)
+                        testbench = re.sub(dumpvars_pattern, new_dumpvars, testbench)
+                        main = test_case.stdin
+                    elif test_case.stdin.find('initial') != -1:
+                        # replace wave dump
+                        testbench = re.sub(dumpfile_pattern, new_dumpfile, test_case.stdin)
+                        testbench = re.sub(dumpvars_pattern, new_dumpvars, testbench)
+                        main = code
+
+            try:
+                main, input_ports, output_ports = embed_inout_module(main)
+                testbench = embed_inout_testbench(testbench, input_ports, output_ports)
+            except:
+                main = code
+                testbench = test_case.stdin
+
+            encoded = build_hdl_bundle(main, testbench)
+            if bundles is not None:
+                bundles[bundle_key] = encoded
 
         # judge0 params
         params = {